@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+import os
+import glob
+import numpy as np
+
+# === Archivo histórico de ciclos ===
+# Cada ciclo se agrega a un NetCDF4 por malla y por año (archivo_cams_<malla>_<año>.nc)
+# con dimensión ilimitada `ciclo`. Las variables van comprimidas (zlib + shuffle) en
+# bloques de (1 ciclo, todos los plazos, TESELA x TESELA puntos): leer un ciclo completo
+# toca pocos bloques y leer la serie de un punto en N ciclos toca solo N bloques
+# pequeños, sin recorrer archivos completos. Volver a archivar el mismo ciclo
+# sobrescribe su entrada. El número de plazos de cada archivo es el de
+# descarga_cams.HORAS_PRONOSTICO al crearlo (descarga.horas de la configuración).
+DIR_ARCHIVO = "/home/arw/cams/archivo/"
+ARCHIVAR = True
+TESELA = 8
+COMPRESION = 4
+
+# Malla -> [(campo en `datos` de cargar_datos, variable en el archivo, unidades)]
+VARIABLES = {
+    "ca": [("pm10", "pm10", "µg/m³"), ("pm25", "pm2p5", "µg/m³"), ("dust_total", "dust_total", "µg/m³")],
+    "aod": [("aod", "duaod550", "1")],
+}
+MALLA_VARIABLE = {nombre: malla for malla, vs in VARIABLES.items() for _, nombre, _ in vs}
+# Las consultas aceptan también los nombres de `datos` (pm25, aod)
+_ALIAS = {clave: nombre for vs in VARIABLES.values() for clave, nombre, _ in vs}
+_COORDENADAS = {"ca": ("lat", "lon"), "aod": ("lat_aod", "lon_aod")}
+_EPOCA = np.datetime64("1970-01-01T00", "h")
+
+def _ruta(malla, anio, directorio=None):
+    return os.path.join(directorio or DIR_ARCHIVO, f"archivo_cams_{malla}_{anio}.nc")
+
+def _horas(ciclo):
+    return int((np.datetime64(ciclo, "h") - _EPOCA) / np.timedelta64(1, "h"))
+
+def _crear(ruta, malla, lat, lon):
+    import netCDF4
+    import descarga_cams
+
+    horas = descarga_cams.HORAS_PRONOSTICO
+    ds = netCDF4.Dataset(ruta, "w", format="NETCDF4")
+    ds.createDimension("ciclo", None)
+    ds.createDimension("plazo", horas)
+    ds.createDimension("lat", len(lat))
+    ds.createDimension("lon", len(lon))
+    v = ds.createVariable("ciclo", "i8", ("ciclo",))
+    v.units = "hours since 1970-01-01 00:00:00"
+    ds.createVariable("plazo", "i4", ("plazo",))[:] = np.arange(horas)
+    ds.createVariable("lat", "f8", ("lat",))[:] = lat
+    ds.createVariable("lon", "f8", ("lon",))[:] = lon
+    bloque = (1, horas, min(TESELA, len(lat)), min(TESELA, len(lon)))
+    for _, nombre, unidades in VARIABLES[malla]:
+        v = ds.createVariable(nombre, "f4", ("ciclo", "plazo", "lat", "lon"), zlib=True,
+                              complevel=COMPRESION, shuffle=True, chunksizes=bloque, fill_value=np.nan)
+        v.units = unidades
+    return ds
+
+# Agrega (o reemplaza) el ciclo de `datos` en el archivo. `plazo_inicial` permite
+# archivar un bloque de plazos del flujo incremental.
+def archivar(datos, directorio=None, plazo_inicial=0):
+    import netCDF4
+
+    directorio = directorio or DIR_ARCHIVO
+    os.makedirs(directorio, exist_ok=True)
+    ciclo = np.datetime64(datos["ciclo"], "h")
+    rutas = []
+    for malla, variables in VARIABLES.items():
+        clave_lat, clave_lon = _COORDENADAS[malla]
+        lat, lon = np.asarray(datos[clave_lat]), np.asarray(datos[clave_lon])
+        ruta = _ruta(malla, ciclo.astype(object).year, directorio)
+        ds = netCDF4.Dataset(ruta, "a") if os.path.exists(ruta) else _crear(ruta, malla, lat, lon)
+        with ds:
+            if ds.dimensions["lat"].size != len(lat) or not np.allclose(ds["lat"][:], lat) \
+                    or ds.dimensions["lon"].size != len(lon) or not np.allclose(ds["lon"][:], lon):
+                raise ValueError(f"La malla de {ruta} no coincide con la del ciclo {ciclo}")
+            existentes = ds["ciclo"][:].filled(-1) if ds.dimensions["ciclo"].size else np.array([], dtype=np.int64)
+            coincidencia = np.flatnonzero(existentes == _horas(ciclo))
+            indice = int(coincidencia[0]) if len(coincidencia) else len(existentes)
+            ds["ciclo"][indice] = _horas(ciclo)
+            horas = ds.dimensions["plazo"].size
+            for clave, nombre, _ in variables:
+                campo = np.asarray(datos[clave], dtype=np.float32)
+                n = min(len(campo), horas - plazo_inicial)
+                if n < len(campo):
+                    print(f"⚠️ {os.path.basename(ruta)} tiene {horas} plazos: {nombre} del ciclo {ciclo} "
+                          f"se archiva hasta el plazo {horas - 1}")
+                if n > 0:
+                    ds[nombre][indice, plazo_inicial:plazo_inicial + n] = campo[:n]
+        rutas.append(ruta)
+    return rutas
+
+# Versión para el flujo operativo: respeta ARCHIVAR, registra la etapa y no interrumpe
+# el procesamiento si el archivo falla. Devuelve True si terminó sin errores.
+def agregar_ciclo(datos, plazo_inicial=0, directorio=None):
+    import metricas_cams
+
+    if not ARCHIVAR:
+        return True
+    try:
+        with metricas_cams.etapa("archivo"):
+            archivar(datos, directorio, plazo_inicial)
+    except Exception as e:
+        print(f"❌ Error archivando el ciclo {datos.get('ciclo')}: {e}")
+        return False
+    print(f"🗄️ Ciclo {datos['ciclo']} agregado al archivo (plazos desde {plazo_inicial})")
+    return True
+
+# === Consultas ===
+# Índice de ciclos archivados de una malla: [(ciclo, ruta, posición)] ordenado por ciclo
+def _indice(malla, directorio=None):
+    import netCDF4
+
+    entradas = []
+    for ruta in sorted(glob.glob(_ruta(malla, "*", directorio))):
+        with netCDF4.Dataset(ruta) as ds:
+            horas = ds["ciclo"][:].filled(-1) if ds.dimensions["ciclo"].size else []
+        entradas += [(_EPOCA + np.timedelta64(int(h), "h"), ruta, k) for k, h in enumerate(horas) if h >= 0]
+    return sorted(entradas, key=lambda e: e[0])
+
+def ciclos(malla="ca", directorio=None):
+    return np.array([e[0] for e in _indice(malla, directorio)], dtype="datetime64[h]")
+
+def _seleccionar(variable, n_ciclos, hasta, directorio):
+    if variable not in MALLA_VARIABLE:
+        raise ValueError(f"Variable desconocida en el archivo: {variable}")
+    entradas = _indice(MALLA_VARIABLE[variable], directorio)
+    if hasta is not None:
+        entradas = [e for e in entradas if e[0] <= np.datetime64(hasta, "h")]
+    # None = todos los ciclos; 0 = ninguno
+    return entradas if n_ciclos is None else entradas[max(len(entradas) - n_ciclos, 0):]
+
+def _leer(variable, entradas, indexar):
+    import netCDF4
+
+    # Una lectura por archivo con las posiciones de todos sus ciclos
+    resultado = [None] * len(entradas)
+    por_archivo = {}
+    for k, (_, ruta, pos) in enumerate(entradas):
+        por_archivo.setdefault(ruta, []).append((k, pos))
+    for ruta, posiciones in por_archivo.items():
+        with netCDF4.Dataset(ruta) as ds:
+            v = ds[variable]
+            v.set_auto_mask(False)
+            bloque = v[[p for _, p in posiciones], ...] if not indexar else indexar(ds, v, [p for _, p in posiciones])
+        for (k, _), valores in zip(posiciones, bloque):
+            resultado[k] = valores
+    return resultado
+
+# Apila los valores de varios ciclos; los archivos de años con distinto número de plazos
+# se completan con NaN hasta el mayor
+def _apilar(valores):
+    horas = max(v.shape[0] for v in valores)
+    return np.stack([np.pad(v, [(0, horas - v.shape[0])] + [(0, 0)] * (v.ndim - 1), constant_values=np.nan)
+                     for v in valores])
+
+# Serie de los últimos `n_ciclos` ciclos (hasta `hasta`, inclusive) en el punto de malla
+# más cercano a lat/lon. Devuelve (ciclos, valores[ciclo, plazo], (lat, lon) del punto).
+def serie_punto(variable, lat, lon, n_ciclos=30, hasta=None, directorio=None):
+    variable = _ALIAS.get(variable, variable)
+    entradas = _seleccionar(variable, n_ciclos, hasta, directorio)
+    if not entradas:
+        return np.array([], dtype="datetime64[h]"), np.empty((0, 0), dtype=np.float32), None
+    punto = {}
+
+    def indexar(ds, v, posiciones):
+        i = int(np.abs(ds["lat"][:] - lat).argmin())
+        j = int(np.abs(ds["lon"][:] - lon).argmin())
+        punto["coordenadas"] = (float(ds["lat"][i]), float(ds["lon"][j]))
+        return v[posiciones, :, i, j]
+
+    valores = _leer(variable, entradas, indexar)
+    return (np.array([e[0] for e in entradas], dtype="datetime64[h]"), _apilar(valores),
+            punto["coordenadas"])
+
+# Campos completos de los últimos `n_ciclos` ciclos: (ciclos, valores[ciclo, plazo, lat, lon])
+def campos(variable, n_ciclos=None, hasta=None, directorio=None):
+    variable = _ALIAS.get(variable, variable)
+    entradas = _seleccionar(variable, n_ciclos, hasta, directorio)
+    if not entradas:
+        return np.array([], dtype="datetime64[h]"), None
+    return (np.array([e[0] for e in entradas], dtype="datetime64[h]"),
+            _apilar(_leer(variable, entradas, None)))
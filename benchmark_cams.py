@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import datetime
+import resource
+import tempfile
+import subprocess
+from multiprocessing import Pool
+
+import matplotlib
+matplotlib.use("Agg")
+
+import fixtures_cams
+import procesamiento_cams as pc
+import envio_cams
+import metricas_cams
+
+# === Benchmark del flujo de graficado de CAMS ===
+# Corre cada etapa (lectura, campos derivados, graficado por frame, GIF, ZIP y envío a un
+# directorio local) sobre datos sintéticos y agrega los tiempos, frames/s y RSS máximo
+# a un historial JSON (ignorado por git). No requiere credenciales de CDS ni acceso a /home/arw.
+HISTORIAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_historial.json")
+
+def _rss_mb(quien=resource.RUSAGE_SELF):
+    return metricas_cams.rss_max_bytes(quien) / 2 ** 20
+
+# La memoria se mide solo con el RSS máximo del sistema operativo: tracemalloc encarece
+# cada asignación y, activo durante la etapa, inflaría los tiempos de pared y de CPU
+def medir(resultados, nombre, funcion, frames=None):
+    t_cpu = os.times()
+    t0 = time.perf_counter()
+    valor = funcion()
+    pared = time.perf_counter() - t0
+    t_cpu_fin = os.times()
+
+    cpu = sum(t_cpu_fin[k] - t_cpu[k] for k in range(4))  # usuario y sistema, propio y de hijos
+    etapa = {
+        "segundos": round(pared, 4),
+        "cpu_segundos": round(cpu, 4),
+        "rss_max_mb": round(_rss_mb(), 1),
+        "rss_max_hijos_mb": round(_rss_mb(resource.RUSAGE_CHILDREN), 1),
+    }
+    if frames:
+        etapa["frames"] = frames
+        etapa["frames_por_segundo"] = round(frames / pared, 3) if pared > 0 else None
+    resultados[nombre] = etapa
+    print(f"⏱️ {nombre}: {etapa['segundos']:.2f} s" +
+          (f" ({etapa['frames_por_segundo']} frames/s)" if frames else ""))
+    return valor
+
+def _commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def ejecutar(horas=24, workers=None, productos=None, base_dir=None):
+    temporal = base_dir is None
+    base_dir = base_dir or tempfile.mkdtemp(prefix="bench_cams_")
+    workers = workers or pc.NUM_WORKERS
+    etapas = {}
+    try:
+        rutas = medir(etapas, "fixtures", lambda: fixtures_cams.preparar_entorno(base_dir, horas))
+        datasets = medir(etapas, "lectura", lambda: pc.abrir_datasets(rutas["datos"]))
+        datos = medir(etapas, "campos_derivados", lambda: pc.cargar_datos(rutas["datos"], datasets=datasets))
+        recursos = medir(etapas, "recursos", lambda: pc.cargar_recursos(datos))
+
+        lista = pc.definir_productos(datos, recursos, pc.crear_etiqueta_hora())
+        if productos:
+            lista = [p for p in lista if p["nombre"] in productos]
+
+        with Pool(processes=workers) as pool:
+            for producto in lista:
+                nombre = producto["nombre"]
+                n_frames = min(len(producto["parametros"]["variable"]), len(producto["parametros"]["tiempos"]))
+                medir(etapas, f"graficado:{nombre}",
+                      lambda: pc.graficar_producto(producto, pool=pool, usar_cache=False), frames=n_frames)
+                medir(etapas, f"gif:{nombre}", lambda: pc.crear_gif(nombre), frames=n_frames)
+                ruta_zip = medir(etapas, f"zip:{nombre}", lambda: pc.crear_zip(nombre))
+                archivos = sorted(
+                    os.path.join(pc.IMG_DIR, f) for f in os.listdir(pc.IMG_DIR)
+                    if f.startswith(f"{nombre}_") or f in (f"{nombre}.gif", os.path.basename(ruta_zip))
+                )
+                destino = os.path.join(rutas["destino"], producto["subcarpeta"], "images")
+                medir(etapas, f"envio:{nombre}", lambda: envio_cams.subir(archivos, destino))
+
+        frames_total = sum(e.get("frames", 0) for k, e in etapas.items() if k.startswith("graficado:"))
+        segundos_graficado = sum(e["segundos"] for k, e in etapas.items() if k.startswith("graficado:"))
+        return {
+            "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": _commit_actual(),
+            "python": sys.version.split()[0],
+            "horas": horas,
+            "workers": workers,
+            "frames_por_segundo": round(frames_total / segundos_graficado, 3) if segundos_graficado else None,
+            "etapas": etapas,
+        }
+    finally:
+        if temporal:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+def guardar_historial(registro, ruta=HISTORIAL):
+    historial = []
+    if os.path.exists(ruta):
+        with open(ruta, encoding="utf-8") as f:
+            historial = json.load(f)
+    historial.append(registro)
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(historial, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del flujo de graficado de CAMS con datos sintéticos")
+    parser.add_argument("--horas", type=int, default=24, help="plazos por producto (121 en operación)")
+    parser.add_argument("--workers", type=int, default=None, help="procesos de graficado")
+    parser.add_argument("--producto", action="append", help="limitar a estos productos (p. ej. cams_pm10_icca)")
+    parser.add_argument("--historial", default=HISTORIAL, help="archivo JSON donde se acumulan los resultados")
+    args = parser.parse_args()
+
+    registro = ejecutar(args.horas, args.workers, args.producto)
+    guardar_historial(registro, args.historial)
+    print(f"📈 {registro['frames_por_segundo']} frames/s; resultados agregados a {args.historial}")
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import hashlib
+import numpy as np
+
+# === Caché de frames renderizados entre ejecuciones ===
+# Cada frame se identifica con un hash de su porción de datos, niveles, colormap, título
+# y la versión del estilo de graficado. Si la clave no cambió y el PNG sigue en disco,
+# el frame se reutiliza. Hay que incrementar VERSION_ESTILO cada vez que cambie el
+# aspecto de los mapas (fuentes, tamaños, logos, shapefiles, etc.).
+VERSION_ESTILO = 1
+
+def _actualizar(h, valor):
+    if isinstance(valor, np.ndarray):
+        arreglo = np.ascontiguousarray(valor)
+        h.update(f"{arreglo.dtype}{arreglo.shape}".encode("utf-8"))
+        h.update(arreglo.tobytes())
+    elif isinstance(valor, (list, tuple)):
+        h.update(f"[{len(valor)}".encode("utf-8"))
+        for v in valor:
+            _actualizar(h, v)
+        h.update(b"]")
+    elif hasattr(valor, "colors") and hasattr(valor, "name"):
+        # Colormap de matplotlib: se identifica por sus colores
+        h.update(str(valor.name).encode("utf-8"))
+        _actualizar(h, np.asarray(valor.colors))
+    else:
+        h.update(repr(valor).encode("utf-8"))
+
+# Parte de la clave común a todos los frames de un producto (se calcula una sola vez)
+def huella_estilo(*componentes):
+    h = hashlib.sha1(f"estilo-v{VERSION_ESTILO}".encode("utf-8"))
+    for c in componentes:
+        _actualizar(h, c)
+    return h.hexdigest()
+
+def clave_frame(huella, variable_i, titulo):
+    h = hashlib.sha1(huella.encode("utf-8"))
+    _actualizar(h, np.asarray(variable_i))
+    _actualizar(h, titulo)
+    return h.hexdigest()
+
+def ruta_indice(nombre_archivo_base):
+    directorio, nombre = os.path.split(nombre_archivo_base)
+    return os.path.join(directorio, f".{nombre}.cache.json")
+
+# Índice {número de frame: clave} del producto
+def leer_indice(nombre_archivo_base):
+    try:
+        with open(ruta_indice(nombre_archivo_base), encoding="utf-8") as f:
+            return {int(k): v for k, v in json.load(f).items()}
+    except (OSError, ValueError):
+        return {}
+
+def guardar_indice(nombre_archivo_base, indice):
+    ruta = ruta_indice(nombre_archivo_base)
+    ruta_tmp = f"{ruta}.{os.getpid()}.tmp"
+    with open(ruta_tmp, "w", encoding="utf-8") as f:
+        json.dump({str(k): v for k, v in sorted(indice.items())}, f, indent=0)
+    os.replace(ruta_tmp, ruta)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import os
+import hashlib
+import numpy as np
+
+# === Caché de geometrías recortadas y simplificadas ===
+# Los shapefiles se leen, recortan a la extensión del mapa y se simplifican a la
+# resolución de la figura una sola vez. El resultado se guarda como arreglos de
+# vértices listos para dibujar; la clave incluye el mtime del shapefile, así que
+# cualquier cambio en el archivo fuente invalida la entrada.
+DIR_CACHE = "/home/arw/cams/cache_geometria/"
+VERSION_CACHE = 1
+
+# Margen alrededor de la extensión para que los bordes del recorte queden fuera del mapa
+MARGEN_RECORTE = 0.02
+
+def _clave_cache(ruta_shp, extension, resolucion, minimo_px=0):
+    st = os.stat(ruta_shp)
+    partes = [
+        os.path.abspath(ruta_shp), str(st.st_mtime_ns), str(st.st_size),
+        ",".join(f"{v:.4f}" for v in extension), str(resolucion), str(VERSION_CACHE),
+    ]
+    if minimo_px:
+        partes.append(f"minimo={minimo_px}")
+    texto = "|".join(partes)
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()[:16]
+
+def _anillos(geom):
+    # Devuelve las coordenadas de todas las líneas de contorno de una geometría
+    if geom is None or geom.is_empty:
+        return []
+    tipo = geom.geom_type
+    if tipo == "Polygon":
+        return [np.asarray(geom.exterior.coords)] + [np.asarray(r.coords) for r in geom.interiors]
+    if tipo in ("LineString", "LinearRing"):
+        return [np.asarray(geom.coords)]
+    if hasattr(geom, "geoms"):
+        return [a for g in geom.geoms for a in _anillos(g)]
+    return []
+
+def _generar_trazos(ruta_shp, extension, resolucion, minimo_px=0):
+    import geopandas as gpd
+
+    lon_min, lon_max, lat_min, lat_max = extension
+    margen_x = (lon_max - lon_min) * MARGEN_RECORTE
+    margen_y = (lat_max - lat_min) * MARGEN_RECORTE
+    caja = (lon_min - margen_x, lat_min - margen_y, lon_max + margen_x, lat_max + margen_y)
+
+    gdf = gpd.read_file(ruta_shp, bbox=caja)
+    if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(4326)
+
+    # Medio píxel de la figura: los detalles menores no se distinguen en la imagen final
+    tolerancia = (lon_max - lon_min) / resolucion * 0.5
+    geometrias = gdf.geometry.clip_by_rect(*caja).simplify(tolerancia, preserve_topology=False)
+
+    trazos = []
+    for geom in geometrias:
+        trazos.extend(a[:, :2] for a in _anillos(geom) if len(a) >= 2)
+    if minimo_px:
+        # Islas y lagos que ocupan menos de `minimo_px` píxeles en ambos ejes
+        minimo = (lon_max - lon_min) / resolucion * minimo_px
+        trazos = [t for t in trazos if np.ptp(t[:, 0]) >= minimo or np.ptp(t[:, 1]) >= minimo]
+    return trazos
+
+# Devuelve la lista de trazos (arreglos Nx2 lon/lat) de un shapefile para una extensión;
+# con `minimo_px` se descartan los anillos más pequeños que ese número de píxeles
+def cargar_geometria(ruta_shp, extension, resolucion, dir_cache=None, minimo_px=0):
+    dir_cache = dir_cache or DIR_CACHE
+    os.makedirs(dir_cache, exist_ok=True)
+    nombre = os.path.splitext(os.path.basename(ruta_shp))[0]
+    ruta_cache = os.path.join(dir_cache, f"{nombre}_{_clave_cache(ruta_shp, extension, resolucion, minimo_px)}.npz")
+
+    if os.path.exists(ruta_cache):
+        with np.load(ruta_cache) as datos:
+            vertices, cortes = datos["vertices"], datos["cortes"]
+        if len(cortes) < 2:
+            return []
+        return np.split(vertices, cortes[1:-1])
+
+    trazos = _generar_trazos(ruta_shp, extension, resolucion, minimo_px)
+    cortes = np.cumsum([0] + [len(t) for t in trazos])
+    vertices = np.concatenate(trazos) if trazos else np.empty((0, 2))
+
+    ruta_tmp = f"{ruta_cache}.{os.getpid()}.tmp.npz"
+    np.savez(ruta_tmp, vertices=vertices, cortes=cortes)
+    os.replace(ruta_tmp, ruta_cache)
+    return trazos
+
+# Dibuja los trazos en un solo LineCollection (equivalente a shp.plot con facecolor='none')
+def dibujar_geometria(ax, trazos, transform=None, color='black', linewidth=0.5):
+    from matplotlib.collections import LineCollection
+
+    coleccion = LineCollection(trazos, colors=color, linewidths=linewidth,
+                               transform=transform if transform is not None else ax.transData)
+    ax.add_collection(coleccion, autolim=False)
+    return coleccion
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import argparse
+import datetime
+
+# === Punto de entrada único del flujo CAMS ===
+# Subcomandos:
+#   descargar    descarga y valida los NetCDF del día
+#   graficar     genera los PNG, GIF y ZIP y los envía al servidor
+#   sincronizar  solo vuelve a enviar lo que ya está en el directorio de imágenes
+#   todo         descarga y grafica en el mismo proceso
+#   reanudar     retoma una corrida interrumpida: solo los frames y envíos pendientes
+#   servir       servicio HTTP local que grafica bajo demanda los plazos fuera del programa
+# Los directorios, productos, extensiones y número de workers se leen de un archivo
+# JSON (configuracion_cams.json por defecto). Cada subcomando importa solo los módulos
+# que necesita: descargar y sincronizar no cargan xarray, matplotlib ni cartopy.
+CONFIGURACION = os.path.join(os.path.dirname(os.path.abspath(__file__)), "configuracion_cams.json")
+
+def cargar_configuracion(ruta=None):
+    if ruta is None and not os.path.exists(CONFIGURACION):
+        return {}
+    with open(ruta or CONFIGURACION, encoding="utf-8") as f:
+        return json.load(f)
+
+# Aplica la configuración sobre las constantes de los módulos; las claves ausentes
+# conservan los valores por defecto de cada módulo
+def aplicar_configuracion(config):
+    import procesamiento_cams as pc
+    import descarga_cams
+    import envio_cams
+    import cache_geometria
+    import series_cams
+    import archivo_cams
+    import ensamble_cams
+    import servicio_cams
+    import salida_cams
+
+    directorios = config.get("directorios", {})
+    pc.DATA_DIR = directorios.get("datos", pc.DATA_DIR)
+    descarga_cams.WORKDIR = directorios.get("datos", descarga_cams.WORKDIR)
+    pc.IMG_DIR = directorios.get("imagenes", pc.IMG_DIR)
+    pc.DESTINO = directorios.get("destino", pc.DESTINO)
+    cache_geometria.DIR_CACHE = directorios.get("cache_geometria", cache_geometria.DIR_CACHE)
+
+    recursos = config.get("recursos", {})
+    pc.SHP_COSTAS = recursos.get("costas", pc.SHP_COSTAS)
+    pc.SHP_COSTAS_AOD = recursos.get("costas_aod", pc.SHP_COSTAS_AOD)
+    pc.SHP_PAISES = recursos.get("paises", pc.SHP_PAISES)
+    pc.SHP_DEPARTAMENTOS = recursos.get("departamentos", pc.SHP_DEPARTAMENTOS)
+    pc.RUTA_LOGO = recursos.get("logo", pc.RUTA_LOGO)
+    pc.RUTA_ICCA = recursos.get("icca", pc.RUTA_ICCA)
+
+    if config.get("productos") is not None:
+        desconocidos = set(config["productos"]) - set(pc.SUBCARPETAS)
+        if desconocidos:
+            raise ValueError(f"Productos desconocidos en la configuración: {', '.join(sorted(desconocidos))}")
+        pc.PRODUCTOS = list(config["productos"])
+
+    # Extensiones como [lon_min, lon_max, lat_min, lat_max]; CDS las pide como [N, O, S, E]
+    extensiones = config.get("extensiones", {})
+    for clave, constante in (("centroamerica", "AREA_POLVO"), ("aod", "AREA_AOD")):
+        if clave in extensiones:
+            lon_min, lon_max, lat_min, lat_max = extensiones[clave]
+            setattr(descarga_cams, constante, [lat_max, lon_min, lat_min, lon_max])
+
+    graficado = config.get("graficado", {})
+    pc.USAR_PLANTILLA = graficado.get("plantilla", pc.USAR_PLANTILLA)
+    pc.RASTER_PM = graficado.get("raster_pm", pc.RASTER_PM)
+    pc.FORMATO_FRAMES = graficado.get("formato", pc.FORMATO_FRAMES)
+    pc.PROGRAMA_FRAMES = graficado.get("programa_frames", pc.PROGRAMA_FRAMES)
+    pc.AOD_REDUCIDO = graficado.get("aod_reducido", pc.AOD_REDUCIDO)
+
+    servicio = config.get("servicio", {})
+    servicio_cams.DIRECCION = servicio.get("direccion", servicio_cams.DIRECCION)
+    servicio_cams.PUERTO = servicio.get("puerto", servicio_cams.PUERTO)
+    servicio_cams.URL_PUBLICA = servicio.get("url", servicio_cams.URL_PUBLICA)
+
+    # Los plazos fuera del programa solo llegan al visor a través del manifiesto y del
+    # servicio; sin ellos el programa solo quitaría frames de la web y de las animaciones
+    if pc.PROGRAMA_FRAMES and not (salida_cams.tamano_fijo(pc.FORMATO_FRAMES) and servicio_cams.URL_PUBLICA):
+        print("⚠️ graficado.programa_frames requiere un formato con manifiesto (webp o png8) y "
+              "servicio.url: se grafican todos los plazos")
+        pc.PROGRAMA_FRAMES = None
+
+    series = config.get("series", {})
+    series_cams.EXPORTAR = series.get("exportar", series_cams.EXPORTAR)
+    series_cams.FORMATOS = series.get("formatos", series_cams.FORMATOS)
+    series_cams.ESTACIONES = series.get("estaciones", series_cams.ESTACIONES)
+    series_cams.COLUMNA_NOMBRE = series.get("columna_nombre", series_cams.COLUMNA_NOMBRE)
+
+    archivo = config.get("archivo", {})
+    archivo_cams.DIR_ARCHIVO = archivo.get("directorio", archivo_cams.DIR_ARCHIVO)
+    archivo_cams.ARCHIVAR = archivo.get("activar", archivo_cams.ARCHIVAR)
+
+    ensamble = config.get("ensamble", {})
+    ensamble_cams.ACTIVAR = ensamble.get("activar", ensamble_cams.ACTIVAR)
+    ensamble_cams.N_CICLOS = ensamble.get("ciclos", ensamble_cams.N_CICLOS)
+    if ensamble_cams.N_CICLOS < 2:
+        raise ValueError(f"ensamble.ciclos debe ser al menos 2 (es {ensamble_cams.N_CICLOS})")
+    # Los ciclos anteriores del ensamble solo se leen del archivo histórico
+    if ensamble_cams.ACTIVAR and not archivo_cams.ARCHIVAR:
+        print("⚠️ ensamble.activar requiere archivo.activar: los ciclos no se archivan y el ensamble "
+              "no tendrá ciclos anteriores con los que calcularse")
+
+    workers = config.get("workers", {})
+    pc.NUM_WORKERS = workers.get("graficado") or pc.NUM_WORKERS
+    envio_cams.ENVIOS_SIMULTANEOS = workers.get("envios") or envio_cams.ENVIOS_SIMULTANEOS
+
+    descarga = config.get("descarga", {})
+    descarga_cams.HORAS_PRONOSTICO = descarga.get("horas", descarga_cams.HORAS_PRONOSTICO)
+    descarga_cams.INTENTOS = descarga.get("intentos", descarga_cams.INTENTOS)
+    descarga_cams.ESPERA_BASE = descarga.get("espera_base", descarga_cams.ESPERA_BASE)
+
+# === Subcomandos ===
+# Cada uno devuelve True si terminó sin errores
+
+def descargar(args):
+    import procesamiento_cams as pc
+    import descarga_cams
+    import metricas_cams
+
+    print(f"Fecha de datos: {args.fecha}")
+    _, errores = descarga_cams.descargar_todo(args.fecha, pc.DATA_DIR)
+    metricas_cams.escribir(pc.DATA_DIR)
+    return not errores
+
+def _graficar():
+    import procesamiento_cams as pc
+    import archivo_cams
+    import ensamble_cams
+    import metricas_cams
+    import registro_cams
+    import series_cams
+
+    os.makedirs(pc.IMG_DIR, exist_ok=True)
+    registro_cams.registrar_entradas(pc.IMG_DIR)
+    datos = pc.cargar_datos(pc.DATA_DIR)
+    recursos, etiqueta_hora = pc.cargar_recursos(datos), pc.crear_etiqueta_hora()
+    productos, fallidos_ensamble = pc.definir_productos(datos, recursos, etiqueta_hora), []
+    try:
+        productos += ensamble_cams.definir_productos(datos, recursos, etiqueta_hora)
+    except Exception as e:
+        print(f"❌ Error calculando el ensamble de ciclos: {e}")
+        fallidos_ensamble.append("ensamble")
+    fallidos = pc.procesar_productos(productos) + fallidos_ensamble
+    if not series_cams.publicar(datos):
+        fallidos.append("series")
+    if not archivo_cams.agregar_ciclo(datos):
+        fallidos.append("archivo")
+    metricas_cams.escribir(pc.IMG_DIR)
+    if fallidos:
+        print(f"❌ Falló el procesamiento o envío de: {', '.join(fallidos)}")
+    return not fallidos
+
+def graficar(args):
+    return _graficar()
+
+def sincronizar(args):
+    from functools import partial
+    import procesamiento_cams as pc
+    import envio_cams
+    import ensamble_cams
+    import metricas_cams
+
+    productos = pc.PRODUCTOS if pc.PRODUCTOS is not None else list(pc.SUBCARPETAS)
+    subcarpetas = {nombre: pc.SUBCARPETAS[nombre] for nombre in productos}
+    if ensamble_cams.ACTIVAR:
+        subcarpetas.update({nombre: ensamble_cams.SUBCARPETA for nombre in ensamble_cams.nombres_productos()})
+    fallidos = envio_cams.ejecutar_envios({
+        nombre: partial(pc.sincronizar, nombre, subcarpeta, empaquetar=args.empaquetar)
+        for nombre, subcarpeta in subcarpetas.items()
+    })
+    metricas_cams.escribir(pc.IMG_DIR)
+    if fallidos:
+        print(f"❌ Falló el envío de: {', '.join(fallidos)}")
+    return not fallidos
+
+def todo(args):
+    import procesamiento_cams as pc
+
+    if args.incremental:
+        import flujo_incremental
+
+        fallidos, envios_fallidos = flujo_incremental.ejecutar(args.fecha, pc.DATA_DIR)
+        return not (fallidos or envios_fallidos)
+
+    ok = descargar(args)
+    if not ok:
+        print("⚠️ Descarga incompleta: se grafican los archivos disponibles")
+    # Los NetCDF se vuelven a abrir desde DATA_DIR (de forma perezosa): los que no se
+    # pudieron descargar conservan los del ciclo anterior
+    return _graficar() and ok
+
+# El registro de frames (registro_cams) hace que el graficado normal ya sea reanudable;
+# este subcomando muestra lo que quedó pendiente y vuelve a correrlo con las mismas
+# entradas que la corrida interrumpida: los NetCDF del ciclo completo o, tras un
+# `todo --incremental`, los bloques que ya se descargaron
+def reanudar(args):
+    import procesamiento_cams as pc
+    import registro_cams
+
+    estados = registro_cams.resumen(pc.IMG_DIR)
+    for producto, e in sorted(estados.items()):
+        faltan = sum(n for estado, n in e["grafico"].items() if estado != "hecho")
+        sin_enviar = sum(n for estado, n in e["envio"].items() if estado != "enviado")
+        if faltan or sin_enviar:
+            print(f"⏯️ {producto}: {faltan} frames por graficar, {sin_enviar} por enviar")
+    for producto, frame, error in registro_cams.errores(pc.IMG_DIR):
+        print(f"⚠️ {producto} frame {frame}: {error}")
+
+    bloques = registro_cams.entradas(pc.IMG_DIR)
+    if bloques:
+        import flujo_incremental
+
+        print(f"⏯️ Se retoma la corrida incremental ({len(bloques)} bloques de plazos)")
+        fallidos, envios_fallidos = flujo_incremental.reanudar(bloques, pc.DATA_DIR,
+                                                               registro_cams.fecha_entradas(pc.IMG_DIR))
+        return not (fallidos or envios_fallidos)
+    return _graficar()
+
+def servir(args):
+    import servicio_cams
+
+    return servicio_cams.servir(args.direccion, args.puerto)
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description="Descarga, graficado y envío de los pronósticos CAMS")
+    parser.add_argument("--config", default=None, help=f"archivo JSON de configuración (por defecto {CONFIGURACION})")
+    subcomandos = parser.add_subparsers(dest="subcomando", required=True)
+
+    fecha = argparse.ArgumentParser(add_help=False)
+    fecha.add_argument("--fecha", default=datetime.date.today().strftime("%Y-%m-%d"),
+                       help="fecha de inicialización YYYY-MM-DD (por defecto hoy)")
+
+    subcomandos.add_parser("descargar", aliases=["download"], parents=[fecha],
+                           help="descargar y validar los NetCDF").set_defaults(funcion=descargar)
+    subcomandos.add_parser("graficar", aliases=["render"],
+                           help="graficar y enviar a partir de los NetCDF en disco").set_defaults(funcion=graficar)
+    p_sinc = subcomandos.add_parser("sincronizar", aliases=["sync"], help="reenviar las imágenes ya generadas")
+    p_sinc.add_argument("--sin-paquetes", dest="empaquetar", action="store_false",
+                        help="no regenerar ni enviar el GIF y el ZIP")
+    p_sinc.set_defaults(funcion=sincronizar)
+    p_todo = subcomandos.add_parser("todo", aliases=["all"], parents=[fecha], help="descargar y graficar")
+    p_todo.add_argument("--incremental", action="store_true",
+                        help="descargar y publicar por bloques de plazos (flujo_incremental)")
+    p_todo.set_defaults(funcion=todo)
+    subcomandos.add_parser("reanudar", aliases=["resume"],
+                           help="graficar y enviar solo lo que quedó pendiente").set_defaults(funcion=reanudar)
+    p_servir = subcomandos.add_parser("servir", aliases=["serve"],
+                                      help="graficar bajo demanda los plazos fuera del programa de frames")
+    p_servir.add_argument("--direccion", default=None, help="dirección de escucha (por defecto la de la configuración)")
+    p_servir.add_argument("--puerto", type=int, default=None, help="puerto (por defecto el de la configuración)")
+    p_servir.set_defaults(funcion=servir)
+    return parser
+
+if __name__ == "__main__":
+    args = crear_parser().parse_args()
+    aplicar_configuracion(cargar_configuracion(args.config))
+    sys.exit(0 if args.funcion(args) else 1)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import os
+import numpy as np
+
+# === Acceso a datos compartido entre procesos ===
+# Los campos derivados se calculan plazo por plazo desde NetCDF abiertos de forma
+# perezosa y se escriben en archivos .npy. A los workers solo viaja la ruta del archivo
+# y el índice del plazo; cada proceso abre el .npy con mmap en modo solo lectura, así
+# que ni el proceso principal ni los workers tienen los 121 plazos en memoria a la vez
+# y no se serializan arreglos en cada tarea.
+
+# Memmaps abiertos en este proceso: (ruta, mtime) -> arreglo. Al abrir una versión nueva
+# se sueltan las anteriores de esa ruta y las de archivos que ya no existen, para que un
+# proceso largo (servicio_cams) no mantenga abiertos los .npy reemplazados o borrados y
+# su espacio en disco se libere.
+_mapas = {}
+
+def _abrir_mapa(ruta):
+    clave = (ruta, os.stat(ruta).st_mtime_ns)
+    mapa = _mapas.get(clave)
+    if mapa is None:
+        for vieja in [c for c in _mapas if c[0] == ruta or not os.path.exists(c[0])]:
+            del _mapas[vieja]
+        mapa = _mapas[clave] = np.load(ruta, mmap_mode="r")
+    return mapa
+
+# Referencia serializable a un arreglo .npy; se comporta como un arreglo de solo lectura
+class CampoMapeado:
+    def __init__(self, ruta, shape=None):
+        self.ruta = ruta
+        self.shape = tuple(shape) if shape is not None else _abrir_mapa(ruta).shape
+
+    def __len__(self):
+        return self.shape[0]
+
+    # Con un índice entero devuelve una referencia perezosa al plazo, no los datos
+    def __getitem__(self, indice):
+        if isinstance(indice, (int, np.integer)):
+            return FrameMapeado(self.ruta, int(indice), self.shape[1:])
+        return _abrir_mapa(self.ruta)[indice]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(_abrir_mapa(self.ruta), dtype=dtype)
+
+class FrameMapeado:
+    def __init__(self, ruta, indice, shape):
+        self.ruta = ruta
+        self.indice = indice
+        self.shape = tuple(shape)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(_abrir_mapa(self.ruta)[self.indice], dtype=dtype)
+
+# Escribe un arreglo completo (logos, mallas) para compartirlo con los workers
+def compartir(ruta, arreglo):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    ruta_tmp = f"{ruta}.{os.getpid()}.tmp.npy"
+    np.save(ruta_tmp, np.asarray(arreglo))
+    # Archivo nuevo (otro inodo): los memmaps ya abiertos sobre la versión anterior siguen válidos
+    os.replace(ruta_tmp, ruta)
+    return CampoMapeado(ruta)
+
+# Calcula un campo plazo por plazo con `calcular_plazo(i)` y lo guarda como .npy
+def materializar(ruta, n_plazos, calcular_plazo, dtype=np.float32):
+    if n_plazos < 1:
+        raise ValueError(f"No hay plazos para {os.path.basename(ruta)}: el NetCDF está vacío o truncado")
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    ruta_tmp = f"{ruta}.{os.getpid()}.tmp.npy"
+    salida = None
+    for i in range(n_plazos):
+        plazo = np.asarray(calcular_plazo(i), dtype=dtype)
+        if salida is None:
+            salida = np.lib.format.open_memmap(ruta_tmp, mode="w+", dtype=dtype, shape=(n_plazos,) + plazo.shape)
+        salida[i] = plazo
+    salida.flush()
+    forma = salida.shape
+    del salida
+    os.replace(ruta_tmp, ruta)
+    return CampoMapeado(ruta, forma)
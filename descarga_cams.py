@@ -1,76 +1,193 @@
 # -*- coding: utf-8 -*-
 import os
+import sys
+import time
+import shutil
+import tempfile
 import datetime
 import zipfile
-import cdsapi
+from concurrent.futures import ThreadPoolExecutor
+import metricas_cams
 
 # Configuración inicial
 WORKDIR = "/var/www/html/cams/"
-os.chdir(WORKDIR)
-
-# Eliminar archivos .zip y .nc previos
-for f in os.listdir(WORKDIR):
-    if f.endswith(".zip") or f.endswith(".nc"):
-        os.remove(os.path.join(WORKDIR, f))
-
-# Fecha de ayer
-yesterday = datetime.date.today() - datetime.timedelta(days=0)
-fecha_str = yesterday.strftime("%Y-%m-%d")
-print(f"Fecha de datos: {fecha_str}")
-etiqueta_hora = f"Hora de creación: {datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')} Hora local"
-
-# Descarga de PM10, PM2.5 y concentraciones de polvo (área Centroamérica)
-client = cdsapi.Client()
-client.retrieve(
-    "cams-global-atmospheric-composition-forecasts",
-    {
-        "variable": [
-            "particulate_matter_2.5um",
-            "particulate_matter_10um",
-            "dust_aerosol_0.03-0.55um_mixing_ratio",
-            "dust_aerosol_0.55-0.9um_mixing_ratio",
-            "dust_aerosol_0.9-20um_mixing_ratio"
-        ],
-        "pressure_level": ["1000"],
-        "date": f"{fecha_str}/{fecha_str}",
-        "time": ["00:00"],
-        "leadtime_hour": [str(i) for i in range(121)],
-        "type": "forecast",
-        "data_format": "netcdf_zip",
-        "area": [17, -93, 11, -82.33],
-    }
-).download("data_polvo.zip")
-
-# Descarga de AOD para el área extendida (lon[-100,0], lat[0,30])
-# Orden: [north, west, south, east] = [30, -100, 0, 0]
-client.retrieve(
-    "cams-global-atmospheric-composition-forecasts",
-    {
-        "variable": ["dust_aerosol_optical_depth_550nm"],
-        "date": f"{fecha_str}/{fecha_str}",
-        "time": ["00:00"],
-        "leadtime_hour": [str(i) for i in range(121)],
-        "type": "forecast",
-        "data_format": "netcdf_zip",
-        "area": [30, -100, 0, 0],
+DATASET = "cams-global-atmospheric-composition-forecasts"
+HORAS_PRONOSTICO = 121
+
+# Áreas de descarga en el orden de CDS: [north, west, south, east]
+AREA_POLVO = [17, -93, 11, -82.33]  # Centroamérica
+AREA_AOD = [30, -100, 0, 0]  # área extendida (lon[-100,0], lat[0,30])
+
+# Reintentos ante fallos de CDS: espera de ESPERA_BASE, 2*ESPERA_BASE, 4*ESPERA_BASE... segundos
+INTENTOS = 4
+ESPERA_BASE = 60
+
+# Las funciones reciben None en lugar de estas constantes como valor por defecto y las
+# leen al llamarse, para que la configuración de cams.py tenga efecto
+
+# Solicitudes a CDS: sufijo de los archivos NetCDF -> parámetros de la petición.
+# `horas` es el número de plazos (0..horas-1) o una secuencia explícita de plazos.
+def crear_solicitudes(fecha_str, horas=None):
+    horas = HORAS_PRONOSTICO if horas is None else horas
+    plazos = range(horas) if isinstance(horas, int) else horas
+    leadtime_hour = [str(i) for i in plazos]
+    return {
+        # PM10, PM2.5 y concentraciones de polvo (área Centroamérica)
+        "polvo": {
+            "variable": [
+                "particulate_matter_2.5um",
+                "particulate_matter_10um",
+                "dust_aerosol_0.03-0.55um_mixing_ratio",
+                "dust_aerosol_0.55-0.9um_mixing_ratio",
+                "dust_aerosol_0.9-20um_mixing_ratio"
+            ],
+            "pressure_level": ["1000"],
+            "date": f"{fecha_str}/{fecha_str}",
+            "time": ["00:00"],
+            "leadtime_hour": leadtime_hour,
+            "type": "forecast",
+            "data_format": "netcdf_zip",
+            "area": AREA_POLVO,
+        },
+        # AOD para el área extendida
+        "aod": {
+            "variable": ["dust_aerosol_optical_depth_550nm"],
+            "date": f"{fecha_str}/{fecha_str}",
+            "time": ["00:00"],
+            "leadtime_hour": leadtime_hour,
+            "type": "forecast",
+            "data_format": "netcdf_zip",
+            "area": AREA_AOD,
+        },
     }
-).download("data_aod.zip")
-
-# Descomprimir y renombrar archivos NetCDF
-def descomprimir_y_renombrar(nombre_zip, sufijo):
-    with zipfile.ZipFile(nombre_zip, "r") as zip_ref:
-        file_list = zip_ref.namelist()
-        for name in file_list:
-            zip_ref.extract(name, WORKDIR)
-            if "plev" in name:
-                os.rename(os.path.join(WORKDIR, name), os.path.join(WORKDIR, f"data_plev_{sufijo}.nc"))
-            elif "sfc" in name:
-                os.rename(os.path.join(WORKDIR, name), os.path.join(WORKDIR, f"data_sfc_{sufijo}.nc"))
-
-descomprimir_y_renombrar("data_polvo.zip", "polvo")
-descomprimir_y_renombrar("data_aod.zip", "aod")
-
-# Eliminar archivos .zip y .nc previos
-for f in os.listdir(WORKDIR):
-    if f.endswith(".zip"):
-        os.remove(os.path.join(WORKDIR, f))
+
+# Nombre final de cada NetCDF contenido en el zip de CDS
+def nombre_destino(nombre, sufijo):
+    if "plev" in nombre:
+        return f"data_plev_{sufijo}.nc"
+    elif "sfc" in nombre:
+        return f"data_sfc_{sufijo}.nc"
+    return None
+
+# Verificación del zip (CRC) y de cada NetCDF (se abre y tiene todos los plazos)
+def validar_zip(ruta_zip, directorio, sufijo, horas_esperadas):
+    import xarray as xr
+
+    with zipfile.ZipFile(ruta_zip, "r") as zip_ref:
+        corrupto = zip_ref.testzip()
+        if corrupto is not None:
+            raise ValueError(f"CRC inválido en {corrupto} dentro de {ruta_zip}")
+        extraidos = {}
+        for name in zip_ref.namelist():
+            destino = nombre_destino(name, sufijo)
+            if destino is None:
+                continue
+            ruta = zip_ref.extract(name, directorio)
+            os.replace(ruta, os.path.join(directorio, destino))
+            extraidos[destino] = os.path.join(directorio, destino)
+
+    if not extraidos:
+        raise ValueError(f"{ruta_zip} no contiene archivos NetCDF reconocibles")
+
+    for destino, ruta in extraidos.items():
+        with xr.open_dataset(ruta) as ds:
+            if "forecast_period" not in ds.coords:
+                raise ValueError(f"{destino} no tiene la coordenada forecast_period")
+            horas = ds.sizes["forecast_period"]
+        if horas != horas_esperadas:
+            raise ValueError(f"{destino} tiene {horas} plazos, se esperaban {horas_esperadas}")
+    return extraidos
+
+# Un intento completo: descarga en un directorio temporal nuevo y, solo si pasa la
+# validación, reemplaza los NetCDF del ciclo anterior en `workdir`
+def _intentar_descarga(cliente, sufijo, peticion, workdir):
+    temporal = tempfile.mkdtemp(prefix=f".descarga_{sufijo}_", dir=workdir)
+    try:
+        ruta_zip = os.path.join(temporal, f"data_{sufijo}.zip")
+        with metricas_cams.etapa("descarga", producto=sufijo):
+            cliente.retrieve(DATASET, peticion).download(ruta_zip)
+        metricas_cams.contar_bytes("descarga", os.path.getsize(ruta_zip), producto=sufijo)
+        extraidos = validar_zip(ruta_zip, temporal, sufijo, len(peticion["leadtime_hour"]))
+        rutas_finales = []
+        for destino, ruta in extraidos.items():
+            final = os.path.join(workdir, destino)
+            os.replace(ruta, final)
+            rutas_finales.append(final)
+        return rutas_finales
+    finally:
+        shutil.rmtree(temporal, ignore_errors=True)
+
+# Descarga un producto con reintentos y espera exponencial. Un zip truncado o corrupto,
+# un CRC inválido o un número de plazos incorrecto se reintentan igual que un fallo de
+# CDS, cada vez con un directorio temporal nuevo.
+def descargar_producto(sufijo, peticion, workdir=None, crear_cliente=None,
+                       intentos=None, espera_base=None, dormir=time.sleep):
+    if crear_cliente is None:
+        import cdsapi
+        crear_cliente = cdsapi.Client
+    workdir = WORKDIR if workdir is None else workdir
+    intentos = INTENTOS if intentos is None else intentos
+    espera_base = ESPERA_BASE if espera_base is None else espera_base
+
+    cliente = crear_cliente()
+    for intento in range(intentos):
+        try:
+            return _intentar_descarga(cliente, sufijo, peticion, workdir)
+        except Exception as e:
+            if intento == intentos - 1:
+                raise
+            espera = espera_base * 2 ** intento
+            print(f"⚠️ Falló la descarga de data_{sufijo}.zip ({e}); reintento en {espera} s")
+            dormir(espera)
+
+# Bloques de plazos para la descarga incremental: 0-23, 24-47, ..., 120
+def bloques_plazos(horas=None, tamano=24):
+    horas = HORAS_PRONOSTICO if horas is None else horas
+    return [range(inicio, min(inicio + tamano, horas)) for inicio in range(0, horas, tamano)]
+
+def limpiar_temporales(workdir=None):
+    workdir = WORKDIR if workdir is None else workdir
+    os.makedirs(workdir, exist_ok=True)
+    for f in os.listdir(workdir):
+        if f.startswith(".descarga_"):
+            shutil.rmtree(os.path.join(workdir, f), ignore_errors=True)
+
+# Descarga concurrente de todas las solicitudes. Devuelve (archivos por sufijo, errores por sufijo);
+# un producto que falla conserva los archivos del ciclo anterior. `etiqueta` se agrega al
+# sufijo de los archivos (p. ej. "_024" para el bloque que empieza en el plazo 24).
+def descargar_todo(fecha_str, workdir=None, crear_cliente=None, intentos=None,
+                   espera_base=None, dormir=time.sleep, horas=None,
+                   etiqueta="", limpiar=True):
+    workdir = WORKDIR if workdir is None else workdir
+    if limpiar:
+        # Limpiar temporales de ejecuciones interrumpidas
+        limpiar_temporales(workdir)
+    else:
+        os.makedirs(workdir, exist_ok=True)
+
+    solicitudes = crear_solicitudes(fecha_str, horas)
+    archivos, errores = {}, {}
+    with ThreadPoolExecutor(max_workers=len(solicitudes)) as executor:
+        futuros = {
+            sufijo: executor.submit(descargar_producto, f"{sufijo}{etiqueta}", peticion, workdir,
+                                    crear_cliente, intentos, espera_base, dormir)
+            for sufijo, peticion in solicitudes.items()
+        }
+        for sufijo, futuro in futuros.items():
+            try:
+                archivos[sufijo] = futuro.result()
+                print(f"✅ Descarga {sufijo} validada: {', '.join(os.path.basename(f) for f in archivos[sufijo])}")
+            except Exception as e:
+                errores[sufijo] = e
+                print(f"❌ Descarga {sufijo} fallida, se conservan los archivos anteriores: {e}")
+    return archivos, errores
+
+if __name__ == "__main__":
+    # Fecha de ayer
+    yesterday = datetime.date.today() - datetime.timedelta(days=0)
+    fecha_str = yesterday.strftime("%Y-%m-%d")
+    print(f"Fecha de datos: {fecha_str}")
+
+    archivos, errores = descargar_todo(fecha_str)
+    metricas_cams.escribir(WORKDIR)
+    sys.exit(1 if errores else 0)
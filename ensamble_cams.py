@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import os
+import numpy as np
+
+# === Ensamble de ciclos consecutivos (lagged ensemble) ===
+# CAMS entrega un solo pronóstico determinista por ciclo; el ensamble se forma con los
+# últimos N_CICLOS ciclos alineados por hora válida: el plazo p del ciclo más reciente
+# corresponde al plazo p + (horas entre ciclos) de cada ciclo anterior. El ciclo del día
+# se toma de los .npy de cargar_datos (lo único que se lee del NetCDF) y los anteriores
+# del archivo histórico (archivo_cams). Media, dispersión, cambio respecto al ciclo
+# anterior y probabilidad de superar cada umbral ICCA se calculan para todos los plazos
+# a la vez y se grafican con el mismo pipeline que los demás productos.
+ACTIVAR = False
+N_CICLOS = 4
+# Mínimo de ciclos con dato para graficar un plazo
+MIN_MIEMBROS = 2
+SUBCARPETA = "ensamble_cams"
+
+# Variable -> (campo en `datos`, nombre en el mapa, niveles de dispersión, niveles de cambio)
+VARIABLES = {
+    "pm10": ("pm10", "PM10", np.arange(0, 105, 5), np.arange(-100, 110, 10)),
+    "pm25": ("pm25", "PM2.5", np.arange(0, 52.5, 2.5), np.arange(-50, 55, 5)),
+}
+NIVELES_PROBABILIDAD = np.arange(0, 110, 10)
+
+def _niveles_icca(variable):
+    import procesamiento_cams as pc
+
+    return pc.niveles_pm10_icca if variable == "pm10" else pc.niveles_pm25_icca
+
+# Umbrales de probabilidad: los límites entre categorías ICCA (sin el 0 ni el máximo)
+def umbrales(variable):
+    return list(_niveles_icca(variable)[1:-1])
+
+# Miembros alineados por hora válida: (miembros, plazos, lat, lon), NaN donde un ciclo
+# anterior ya no alcanza el plazo. El primer miembro es el ciclo más reciente.
+def alinear(actual, ciclo, anteriores, ciclos_anteriores):
+    actual = np.asarray(actual, dtype=np.float32)
+    miembros = np.full((1 + len(ciclos_anteriores),) + actual.shape, np.nan, dtype=np.float32)
+    miembros[0] = actual
+    ciclo = np.datetime64(ciclo, "h")
+    # Del más reciente al más antiguo
+    for k, c in enumerate(ciclos_anteriores[::-1], start=1):
+        desfase = int((ciclo - np.datetime64(c, "h")) / np.timedelta64(1, "h"))
+        n = min(actual.shape[0], anteriores.shape[1] - desfase)
+        if n > 0:
+            miembros[k, :n] = anteriores[len(ciclos_anteriores) - k, desfase:desfase + n]
+    return miembros
+
+# Estadísticos del ensamble; los plazos/puntos con menos de MIN_MIEMBROS quedan en NaN
+def estadisticos(miembros, umbrales):
+    validos = ~np.isnan(miembros)
+    cuenta = validos.sum(axis=0)
+    valores = np.where(validos, miembros, 0)
+    suficientes = cuenta >= MIN_MIEMBROS
+    with np.errstate(invalid="ignore", divide="ignore"):
+        media = valores.sum(axis=0) / cuenta
+        dispersion = np.sqrt(np.where(validos, (miembros - media) ** 2, 0).sum(axis=0) / cuenta)
+        # (umbrales, plazos, lat, lon) en una sola comparación con broadcasting
+        umbrales = np.asarray(umbrales, dtype=np.float32).reshape((-1,) + (1,) * miembros.ndim)
+        probabilidad = 100 * (miembros[None] > umbrales).sum(axis=1) / cuenta
+    return {
+        "media": np.where(suficientes, media, np.nan).astype(np.float32),
+        "dispersion": np.where(suficientes, dispersion, np.nan).astype(np.float32),
+        "cambio": (miembros[0] - miembros[1]).astype(np.float32) if len(miembros) > 1
+                  else np.full(miembros.shape[1:], np.nan, dtype=np.float32),
+        "probabilidad": np.where(suficientes, probabilidad, np.nan).astype(np.float32),
+    }
+
+# Calcula los campos del ensamble y los deja como .npy en dir_campos para los workers.
+# Devuelve {variable: (n_plazos, n_miembros, {medida: CampoMapeado})}; las variables sin
+# ciclos anteriores en el archivo no aparecen.
+def calcular(datos, n_ciclos=None, directorio_archivo=None):
+    import archivo_cams
+    import datos_cams
+    import metricas_cams
+
+    n_ciclos = n_ciclos or N_CICLOS
+    hasta = np.datetime64(datos["ciclo"], "h") - np.timedelta64(1, "h")
+    resultado = {}
+    with metricas_cams.etapa("ensamble"):
+        for variable, (clave, _, _, _) in VARIABLES.items():
+            ciclos, anteriores = archivo_cams.campos(clave, n_ciclos - 1, hasta=hasta, directorio=directorio_archivo)
+            if not len(ciclos):
+                continue
+            miembros = alinear(datos[clave], datos["ciclo"], anteriores, ciclos)
+            campos = estadisticos(miembros, umbrales(variable))
+            # Solo los plazos con suficientes miembros en algún punto
+            con_dato = np.flatnonzero((~np.isnan(miembros)).sum(axis=0).reshape(miembros.shape[1], -1).max(axis=1)
+                                      >= MIN_MIEMBROS)
+            n_plazos = int(con_dato[-1]) + 1 if len(con_dato) else 0
+            if n_plazos == 0:
+                continue
+            compartidos = {}
+            for medida in ("media", "dispersion", "cambio"):
+                compartidos[medida] = datos_cams.compartir(
+                    os.path.join(datos["dir_campos"], f"ens_{medida}_{variable}.npy"), campos[medida][:n_plazos])
+            for umbral, campo in zip(umbrales(variable), campos["probabilidad"]):
+                compartidos[f"prob{umbral:g}"] = datos_cams.compartir(
+                    os.path.join(datos["dir_campos"], f"ens_prob{umbral:g}_{variable}.npy"), campo[:n_plazos])
+            resultado[variable] = (n_plazos, len(ciclos) + 1, compartidos)
+            print(f"🎲 Ensamble {variable}: {len(ciclos) + 1} ciclos, {n_plazos} plazos")
+    return resultado
+
+def nombre_producto(variable, medida):
+    return f"cams_{variable}_ens_{medida}".replace(".", "_")
+
+# Productos del ensamble con los mismos parámetros que definir_productos
+def definir_productos(datos, recursos, etiqueta_hora, n_ciclos=None):
+    import procesamiento_cams as pc
+
+    if not ACTIVAR:
+        return []
+    campos = calcular(datos, n_ciclos)
+    ca = dict(X=datos["X"], Y=datos["Y"], lat=datos["lat"], lon=datos["lon"], logo=recursos["logo"],
+              etiqueta_hora=etiqueta_hora, shapefiles=recursos["shapefiles_ca"], usar_raster=pc.RASTER_PM)
+    productos = []
+    for variable, (n_plazos, n_miembros, compartidos) in campos.items():
+        _, titulo, niveles_dispersion, niveles_cambio = VARIABLES[variable]
+        niveles_icca = _niveles_icca(variable)
+        tiempos = datos["tiempo_sfc_str"][:n_plazos]
+        productos += [
+            {"nombre": nombre_producto(variable, "media"),
+             "parametros": dict(variable=compartidos["media"], tiempos=tiempos, cmap=pc.paleta_icca,
+                                niveles=niveles_icca, niveles_icca=niveles_icca, icca=recursos["icca"],
+                                categorias=pc.categorias, usar_icca=True,
+                                nombre_variable=f"{titulo} ICCA media de {n_miembros} ciclos", **ca)},
+            {"nombre": nombre_producto(variable, "dispersion"),
+             "parametros": dict(variable=compartidos["dispersion"], tiempos=tiempos, cmap="Purples",
+                                niveles=niveles_dispersion,
+                                nombre_variable=f"{titulo} dispersión entre ciclos (µg/m³)", **ca)},
+            {"nombre": nombre_producto(variable, "cambio"),
+             "parametros": dict(variable=compartidos["cambio"], tiempos=tiempos, cmap="RdBu_r",
+                                niveles=niveles_cambio,
+                                nombre_variable=f"{titulo} cambio respecto al ciclo anterior (µg/m³)", **ca)},
+        ]
+        for umbral in umbrales(variable):
+            productos.append(
+                {"nombre": nombre_producto(variable, f"prob{umbral:g}"),
+                 "parametros": dict(variable=compartidos[f"prob{umbral:g}"], tiempos=tiempos, cmap="Reds",
+                                    niveles=NIVELES_PROBABILIDAD,
+                                    nombre_variable=f"Probabilidad {titulo} > {umbral:g} µg/m³ (%)", **ca)})
+    return [dict(p, subcarpeta=SUBCARPETA) for p in productos]
+
+# Nombres de todos los productos posibles (para reenviarlos con cams.py sincronizar)
+def nombres_productos():
+    nombres = []
+    for variable in VARIABLES:
+        nombres += [nombre_producto(variable, m) for m in ("media", "dispersion", "cambio")]
+        nombres += [nombre_producto(variable, f"prob{u:g}") for u in umbrales(variable)]
+    return nombres
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# === Envío de archivos al servidor web ===
+# Cada llamada a `subir` transfiere todos los archivos de un producto en una sola
+# invocación (rsync si está disponible, si no scp con varios archivos). Las conexiones
+# SSH se multiplexan con ControlMaster, así que todos los productos comparten un
+# único handshake por ciclo. Un destino sin "host:" se trata como directorio local.
+SSH_OPCIONES = [
+    "-o", "BatchMode=yes",
+    "-o", "ControlMaster=auto",
+    "-o", "ControlPath=~/.ssh/cams-%r@%h:%p",
+    "-o", "ControlPersist=300",
+]
+ENVIOS_SIMULTANEOS = 3
+
+def es_remoto(destino):
+    return re.match(r"^[^/]+:", destino) is not None
+
+# Copia local: se omiten los archivos que ya están con el mismo tamaño y fecha
+def _copiar_local(archivos, destino):
+    os.makedirs(destino, exist_ok=True)
+    copiados = 0
+    for origen in archivos:
+        final = os.path.join(destino, os.path.basename(origen))
+        st = os.stat(origen)
+        if os.path.exists(final):
+            st_final = os.stat(final)
+            if st_final.st_size == st.st_size and int(st_final.st_mtime) == int(st.st_mtime):
+                continue
+        tmp = f"{final}.tmp"
+        shutil.copy2(origen, tmp)
+        os.replace(tmp, final)
+        copiados += 1
+    return copiados
+
+def _comando_remoto(archivos, destino, usar_rsync):
+    if usar_rsync:
+        # -t conserva la fecha para que rsync omita en el siguiente ciclo los archivos sin cambios
+        return ["rsync", "-t", "-e", " ".join(["ssh"] + SSH_OPCIONES)] + list(archivos) + [f"{destino}/"]
+    return ["scp", "-q"] + SSH_OPCIONES + list(archivos) + [f"{destino}/"]
+
+# Sube una lista de archivos a un directorio destino. Devuelve True si la transferencia terminó bien.
+def subir(archivos, destino, usar_rsync=None):
+    archivos = [a for a in archivos if os.path.exists(a)]
+    if not archivos:
+        return True
+
+    if not es_remoto(destino):
+        try:
+            _copiar_local(archivos, destino)
+            return True
+        except OSError as e:
+            print(f"❌ Error copiando a {destino}: {e}")
+            return False
+
+    if usar_rsync is None:
+        usar_rsync = shutil.which("rsync") is not None
+    resultado = subprocess.run(_comando_remoto(archivos, destino, usar_rsync),
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if resultado.returncode != 0:
+        print(f"❌ Error enviando {len(archivos)} archivos a {destino} "
+              f"(código {resultado.returncode}): {resultado.stderr.strip()}")
+        return False
+    return True
+
+# Ejecuta varias tareas de envío en paralelo. `tareas` es {nombre: función sin argumentos
+# que devuelve True/False}; devuelve la lista de nombres cuyo envío falló.
+def ejecutar_envios(tareas, max_paralelo=None):
+    fallidos = []
+    with ThreadPoolExecutor(max_workers=max_paralelo or ENVIOS_SIMULTANEOS) as executor:
+        futuros = {nombre: executor.submit(tarea) for nombre, tarea in tareas.items()}
+        for nombre, futuro in futuros.items():
+            try:
+                ok = futuro.result()
+            except Exception as e:
+                print(f"❌ {nombre}: {e}")
+                ok = False
+            if not ok:
+                fallidos.append(nombre)
+    return fallidos
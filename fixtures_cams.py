@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import os
+import numpy as np
+import xarray as xr
+
+# === Datos sintéticos con la forma de CAMS ===
+# Genera NetCDF con los mismos nombres de variables, coordenadas forecast_period /
+# forecast_reference_time y extensiones que las descargas reales (Centroamérica y AOD
+# extendido), más shapefiles pequeños de reemplazo. Sirve para benchmarks y pruebas
+# sin credenciales de CDS ni acceso a /home/arw.
+EXTENSION_CA = (-93, -82.33, 11, 17)
+EXTENSION_AOD = (-100, 0, 0, 30)
+RESOLUCION_CAMS = 0.4
+FECHA_REFERENCIA = "2026-01-01T00:00"
+
+def _dataset(extension, variables, horas, con_nivel=False, semilla=0):
+    lon_min, lon_max, lat_min, lat_max = extension
+    lat = np.arange(lat_max, lat_min - 1e-6, -RESOLUCION_CAMS)
+    lon = np.arange(lon_min, lon_max + 1e-6, RESOLUCION_CAMS)
+    LON, LAT = np.meshgrid(lon, lat)
+    rng = np.random.default_rng(semilla)
+
+    dims = ["forecast_reference_time", "forecast_period"] + (["pressure_level"] if con_nivel else []) + ["latitude", "longitude"]
+    coords = {
+        "forecast_reference_time": [np.datetime64(FECHA_REFERENCIA, "ns")],
+        "forecast_period": np.arange(horas).astype("timedelta64[h]").astype("timedelta64[ns]"),
+        "latitude": lat,
+        "longitude": lon,
+    }
+    if con_nivel:
+        coords["pressure_level"] = [1000.0]
+
+    datos = {}
+    for nombre, escala in variables:
+        # Pluma que se desplaza hacia el oeste con el plazo, más ruido suave
+        fase = rng.uniform(0, 2 * np.pi)
+        campo = np.stack([
+            np.exp(-((LON - lon_max + 0.08 * h * (lon_max - lon_min) / 10) ** 2) / 20 - ((LAT - (lat_min + lat_max) / 2) ** 2) / 8)
+            + 0.3 * (1 + np.sin(LON / 2 + fase + h / 6) * np.cos(LAT / 3))
+            for h in range(horas)
+        ]) * escala
+        forma = [1, horas] + ([1] if con_nivel else []) + [len(lat), len(lon)]
+        datos[nombre] = (dims, campo.reshape(forma).astype("float32"))
+    return xr.Dataset(datos, coords=coords)
+
+# Crea data_sfc_polvo.nc, data_plev_polvo.nc y data_sfc_aod.nc en `data_dir`
+def crear_netcdf(data_dir, horas=121, etiqueta=""):
+    os.makedirs(data_dir, exist_ok=True)
+    _dataset(EXTENSION_CA, [("pm10", 120e-9), ("pm2p5", 60e-9)], horas, semilla=1).to_netcdf(
+        os.path.join(data_dir, f"data_sfc_polvo{etiqueta}.nc"))
+    _dataset(EXTENSION_CA, [("aermr04", 15e-9), ("aermr05", 15e-9), ("aermr06", 20e-9)], horas,
+             con_nivel=True, semilla=2).to_netcdf(os.path.join(data_dir, f"data_plev_polvo{etiqueta}.nc"))
+    _dataset(EXTENSION_AOD, [("duaod550", 0.8)], horas, semilla=3).to_netcdf(
+        os.path.join(data_dir, f"data_sfc_aod{etiqueta}.nc"))
+
+# Shapefiles de reemplazo: costa, países y 14 "departamentos" rectangulares.
+# Devuelve las rutas en el orden (costas, países, departamentos).
+def crear_shapefiles(shape_dir):
+    import geopandas as gpd
+    from shapely.geometry import Polygon, box
+
+    os.makedirs(shape_dir, exist_ok=True)
+    rutas = [os.path.join(shape_dir, n) for n in ("costas.shp", "paises.shp", "departamentos.shp")]
+    gpd.GeoDataFrame(geometry=[
+        Polygon([(-98, 19), (-92, 14.5), (-89, 13.2), (-84, 11), (-82, 9), (-78, 8), (-75, 11), (-88, 22), (-98, 25)]),
+        Polygon([(-20, 5), (-5, 4), (0, 6), (0, 30), (-17, 28)]),
+    ], crs=4326).to_file(rutas[0])
+    gpd.GeoDataFrame(geometry=[
+        box(-92.2, 13.7, -88.2, 17.8), box(-90.1, 13.1, -87.7, 14.45),
+        box(-89.4, 12.9, -83.1, 16.0), box(-87.7, 10.7, -83.1, 15.0),
+    ], crs=4326).to_file(rutas[1])
+    gpd.GeoDataFrame({"NOM_DPTO": [f"DEPTO_{k:02d}" for k in range(14)]}, geometry=[
+        box(-90.1 + (k % 7) * 0.34, 13.1 + (k // 7) * 0.67, -90.1 + (k % 7 + 1) * 0.34, 13.1 + (k // 7 + 1) * 0.67)
+        for k in range(14)
+    ], crs=4326).to_file(rutas[2])
+    return rutas
+
+# Apunta las rutas de procesamiento_cams (datos, imágenes, destino, shapefiles, logos y
+# cachés) a un directorio temporal con datos sintéticos. Devuelve el diccionario de rutas.
+def preparar_entorno(base_dir, horas=121):
+    import procesamiento_cams as pc
+    import cache_geometria
+
+    rutas = {
+        "datos": os.path.join(base_dir, "datos"),
+        "imagenes": os.path.join(base_dir, "imagenes"),
+        "destino": os.path.join(base_dir, "destino"),
+        "shapes": os.path.join(base_dir, "shapes"),
+        "cache_geometria": os.path.join(base_dir, "cache_geometria"),
+    }
+    crear_netcdf(rutas["datos"], horas)
+    pc.SHP_COSTAS, pc.SHP_PAISES, pc.SHP_DEPARTAMENTOS = crear_shapefiles(rutas["shapes"])
+
+    repo = os.path.dirname(os.path.abspath(__file__))
+    pc.RUTA_LOGO = os.path.join(repo, "logoMarn_color.png")
+    pc.RUTA_ICCA = os.path.join(repo, "ICCA.jpeg")
+    pc.DATA_DIR = rutas["datos"]
+    pc.IMG_DIR = rutas["imagenes"]
+    pc.DESTINO = rutas["destino"]
+    cache_geometria.DIR_CACHE = rutas["cache_geometria"]
+    os.makedirs(rutas["imagenes"], exist_ok=True)
+    return rutas
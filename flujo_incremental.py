@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import datetime
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+import descarga_cams
+import envio_cams
+import metricas_cams
+import archivo_cams
+import ensamble_cams
+import registro_cams
+import series_cams
+import procesamiento_cams as pc
+
+# === Flujo incremental por bloques de plazos ===
+# La descarga se divide en bloques de plazos (0-23 h, 24-47 h, ...). Cada bloque que
+# llega se grafica y se envía de inmediato, mientras los bloques siguientes siguen en
+# la cola de CDS. Cuando están todos, los NetCDF de los bloques se unen en los del
+# ciclo completo (data_sfc_polvo.nc, ...) y se borran junto con sus .npy, así que
+# graficar, reanudar y servir leen el ciclo nuevo. Con el ciclo completo se exportan las
+# series y se grafican los productos de ensamble, que necesitan todos los plazos, y se
+# generan el GIF y el ZIP de cada producto. Si falta algún bloque no se une nada: los
+# productos quedan con los plazos publicados y las series, el ensamble, el GIF y el ZIP
+# no se generan (los frames de los plazos que faltan serían los del ciclo anterior).
+# Los bloques de la corrida y su fecha quedan en el registro de frames (registro_cams),
+# así que `cams.py reanudar` y el servicio bajo demanda leen los bloques mientras no se
+# unan, y reanudar vuelve a descargar los que faltan o son de otro ciclo.
+TAMANO_BLOQUE = 24
+BLOQUES_SIMULTANEOS = 2
+
+def etiqueta_bloque(plazos):
+    return f"_{plazos.start:03d}"
+
+# Une los NetCDF de los bloques en los del ciclo completo y borra los de cada bloque
+def unir_bloques(data_dir, bloques):
+    import xarray as xr
+
+    etiquetas = [etiqueta_bloque(plazos) for plazos in bloques]
+    for nombre in pc.NETCDF_DATOS:
+        ruta = os.path.join(data_dir, f"{nombre}.nc")
+        ruta_tmp = f"{ruta}.{os.getpid()}.tmp"
+        partes = [xr.open_dataset(os.path.join(data_dir, f"{nombre}{e}.nc")) for e in etiquetas]
+        try:
+            xr.concat(partes, dim="forecast_period", data_vars="minimal", coords="minimal",
+                      compat="override").to_netcdf(ruta_tmp)
+        finally:
+            for ds in partes:
+                ds.close()
+        os.replace(ruta_tmp, ruta)
+    limpiar_bloques(data_dir, etiquetas)
+
+# Borra los NetCDF y los campos .npy de los bloques
+def limpiar_bloques(data_dir, etiquetas):
+    dir_campos = os.path.join(data_dir, ".campos")
+    for etiqueta in etiquetas:
+        rutas = [os.path.join(data_dir, f"{nombre}{etiqueta}.nc") for nombre in pc.NETCDF_DATOS]
+        if os.path.isdir(dir_campos):
+            rutas += [os.path.join(dir_campos, f) for f in os.listdir(dir_campos) if f.endswith(f"{etiqueta}.npy")]
+        for ruta in rutas:
+            if os.path.exists(ruta):
+                os.remove(ruta)
+
+# True si los NetCDF del bloque están en disco y son del ciclo `fecha_str` (YYYY-MM-DD)
+def bloque_vigente(data_dir, plazos, fecha_str):
+    import xarray as xr
+    import numpy as np
+
+    for nombre in pc.NETCDF_DATOS:
+        ruta = os.path.join(data_dir, f"{nombre}{etiqueta_bloque(plazos)}.nc")
+        if not os.path.exists(ruta):
+            return False
+        try:
+            with xr.open_dataset(ruta) as ds:
+                fecha = np.datetime_as_string(ds.forecast_reference_time.values[0], unit="D")
+        except Exception as e:
+            print(f"⚠️ No se pudo leer {os.path.basename(ruta)}: {e}")
+            return False
+        if fecha_str is not None and fecha != fecha_str:
+            print(f"⚠️ {os.path.basename(ruta)} es del ciclo {fecha}, no del {fecha_str}")
+            return False
+    return True
+
+# Encola la descarga de cada bloque; devuelve {plazo_inicial: futuro de descargar_todo}
+def _descargar_bloques(executor, fecha_str, data_dir, bloques, crear_cliente):
+    return {
+        plazos.start: executor.submit(descarga_cams.descargar_todo, fecha_str, data_dir, crear_cliente,
+                                      horas=plazos, etiqueta=etiqueta_bloque(plazos), limpiar=False)
+        for plazos in bloques
+    }
+
+def ejecutar(fecha_str, data_dir=None, tamano_bloque=TAMANO_BLOQUE,
+             bloques_simultaneos=BLOQUES_SIMULTANEOS, crear_cliente=None, horas=None):
+    data_dir = data_dir or pc.DATA_DIR
+    descarga_cams.limpiar_temporales(data_dir)
+    os.makedirs(pc.IMG_DIR, exist_ok=True)
+
+    bloques = descarga_cams.bloques_plazos(horas, tamano_bloque)
+    # Si la corrida se interrumpe, `cams.py reanudar` retoma desde estos bloques
+    registro_cams.registrar_entradas(pc.IMG_DIR, bloques, fecha_str)
+
+    # Un solo pool de graficado para todos los bloques
+    with Pool(processes=pc.NUM_WORKERS) as pool, \
+            ThreadPoolExecutor(max_workers=bloques_simultaneos) as executor:
+        futuros = _descargar_bloques(executor, fecha_str, data_dir, bloques, crear_cliente)
+        # Los bloques se procesan en orden: el primer día se publica en cuanto llega
+        descargados = ((plazos, not futuros[plazos.start].result()[1]) for plazos in bloques)
+        return _procesar_bloques(pool, data_dir, bloques, descargados)
+
+# Retoma una corrida incremental interrumpida. Los bloques que ya están en disco y son del
+# ciclo `fecha_str` se reutilizan; los que faltan, no se pueden leer o quedaron de otro
+# ciclo se vuelven a descargar (sin fecha registrada no se puede, y se dan por fallidos).
+# Los frames ya graficados y enviados se reutilizan (registro_cams).
+def reanudar(bloques, data_dir=None, fecha_str=None, bloques_simultaneos=BLOQUES_SIMULTANEOS,
+             crear_cliente=None):
+    data_dir = data_dir or pc.DATA_DIR
+    descarga_cams.limpiar_temporales(data_dir)
+    os.makedirs(pc.IMG_DIR, exist_ok=True)
+
+    vigentes = {plazos.start: bloque_vigente(data_dir, plazos, fecha_str) for plazos in bloques}
+    por_descargar = [plazos for plazos in bloques if not vigentes[plazos.start]]
+    if por_descargar and fecha_str is None:
+        print("⚠️ El registro no indica la fecha del ciclo: no se descargan los bloques que faltan")
+        por_descargar = []
+    elif por_descargar:
+        print(f"📥 Se vuelven a descargar {len(por_descargar)} bloques del {fecha_str}")
+    with Pool(processes=pc.NUM_WORKERS) as pool, \
+            ThreadPoolExecutor(max_workers=bloques_simultaneos) as executor:
+        futuros = _descargar_bloques(executor, fecha_str, data_dir, por_descargar, crear_cliente)
+        disponibles = ((plazos, not futuros[plazos.start].result()[1] if plazos.start in futuros
+                        else vigentes[plazos.start])
+                       for plazos in bloques)
+        return _procesar_bloques(pool, data_dir, bloques, disponibles)
+
+# Grafica y envía cada bloque de `disponibles` ((plazos, ok) en orden) y, si están todos,
+# los une y completa el ciclo. Devuelve (bloques fallidos, envíos fallidos).
+def _procesar_bloques(pool, data_dir, bloques, disponibles):
+    etiqueta_hora = pc.crear_etiqueta_hora()
+    recursos = None
+    productos = []
+    fallidos = []
+    envios_fallidos = set()
+
+    for plazos, ok in disponibles:
+        if not ok:
+            print(f"❌ Bloque {plazos.start}-{plazos.stop - 1} h incompleto, se omite")
+            fallidos.append(plazos)
+            continue
+
+        print(f"🧩 Procesando bloque {plazos.start}-{plazos.stop - 1} h")
+        datos = pc.cargar_datos(data_dir, etiqueta_bloque(plazos))
+        if recursos is None:
+            recursos = pc.cargar_recursos(datos)
+        productos = pc.definir_productos(datos, recursos, etiqueta_hora)
+        envios_fallidos.update(pc.procesar_productos(productos, pool, indice_inicial=plazos.start,
+                                                     empaquetar=False, podar=False))
+        if not archivo_cams.agregar_ciclo(datos, plazo_inicial=plazos.start):
+            envios_fallidos.add("archivo")
+
+    if fallidos:
+        print("⚠️ Faltan bloques: no se unen los NetCDF del ciclo ni se generan las series, el ensamble, "
+              "el GIF ni el ZIP")
+    elif productos:
+        print("🧷 Uniendo los bloques en los NetCDF del ciclo completo")
+        unir_bloques(data_dir, bloques)
+        registro_cams.registrar_entradas(pc.IMG_DIR)
+        datos = pc.cargar_datos(data_dir)
+        if not series_cams.publicar(datos):
+            envios_fallidos.add("series")
+        try:
+            ensamble = ensamble_cams.definir_productos(datos, recursos, etiqueta_hora)
+        except Exception as e:
+            print(f"❌ Error calculando el ensamble de ciclos: {e}")
+            ensamble = []
+            envios_fallidos.add("ensamble")
+        envios_fallidos.update(pc.procesar_productos(ensamble, pool))
+
+        # GIF y ZIP con todos los frames del ciclo (los PNG ya se enviaron por bloque)
+        envios_fallidos.update(envio_cams.ejecutar_envios({
+            producto["nombre"]: partial(pc.sincronizar, producto["nombre"], producto["subcarpeta"],
+                                        frames=set(), empaquetar=True)
+            for producto in productos
+        }))
+    if envios_fallidos:
+        print(f"❌ Falló el envío de: {', '.join(sorted(envios_fallidos))}")
+
+    return fallidos, sorted(envios_fallidos)
+
+if __name__ == "__main__":
+    fecha_str = datetime.date.today().strftime("%Y-%m-%d")
+    print(f"Fecha de datos: {fecha_str}")
+    fallidos, envios_fallidos = ejecutar(fecha_str)
+    metricas_cams.escribir(pc.IMG_DIR)
+    sys.exit(1 if fallidos or envios_fallidos else 0)
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import zlib
+import struct
+import numpy as np
+from PIL import Image, ImageChops, GifImagePlugin
+
+# === Codificadores GIF y APNG por streaming ===
+# Los frames se escriben al archivo uno por uno con una paleta global común, así que en
+# memoria solo están el frame actual y el anterior. De cada frame solo se cuantiza y
+# codifica el rectángulo que cambió respecto al anterior (disposal=1: el resto de la
+# imagen se conserva), de modo que el mapa base estático no se vuelve a procesar.
+# Dentro de ese rectángulo los píxeles que no cambiaron se marcan como transparentes,
+# lo que reduce mucho el tamaño del GIF cuando solo cambian unas pocas celdas.
+MUESTRAS_PALETA = 3
+INDICE_TRANSPARENTE = 255
+
+def _color_rgb(color):
+    if isinstance(color, str):
+        color = color.lstrip("#")
+        return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+    return tuple(int(c) for c in color[:3])
+
+def _abrir_rgb(frame):
+    imagen = Image.open(frame) if isinstance(frame, (str, os.PathLike)) else frame
+    return imagen.convert("RGB")
+
+# Paleta global calculada una vez por producto a partir de unos pocos frames de muestra.
+# `colores_fijos` (p. ej. la paleta ICCA) se reservan tal cual en la paleta.
+def calcular_paleta(frames_muestra, colores_fijos=()):
+    fijos = [_color_rgb(c) for c in colores_fijos]
+    muestras = [_abrir_rgb(f) for f in frames_muestra]
+    ancho = max(m.width for m in muestras)
+    mosaico = Image.new("RGB", (ancho, sum(m.height for m in muestras)), "white")
+    y = 0
+    for m in muestras:
+        mosaico.paste(m, (0, y))
+        y += m.height
+
+    # La última entrada de la paleta queda reservada para la transparencia
+    n_libres = INDICE_TRANSPARENTE - len(fijos)
+    cuantizada = mosaico.quantize(colors=n_libres, method=Image.Quantize.FASTOCTREE)
+    colores = cuantizada.getpalette()[:3 * n_libres]
+    colores += [0] * (3 * n_libres - len(colores))
+    colores += [v for c in fijos for v in c]
+    colores += [0] * (768 - len(colores))
+
+    paleta = Image.new("P", (1, 1))
+    paleta.putpalette(colores)
+    return paleta
+
+# Base común: cuantiza cada frame con la paleta global y calcula la región que cambió
+class _EscritorIndexado:
+    def __init__(self, ruta, tamano, paleta, duracion_ms=300):
+        self.ruta = ruta
+        self.tamano = tamano
+        self.paleta = paleta
+        self.duracion_ms = duracion_ms
+        self.anterior = None
+        self.indices = None
+        self.n_frames = 0
+        self.ruta_tmp = f"{ruta}.tmp"
+        self.fp = open(self.ruta_tmp, "wb")
+
+    # Devuelve (caja, recorte en modo P, hay_transparencia)
+    def _delta(self, frame):
+        rgb = _abrir_rgb(frame)
+        if rgb.size != self.tamano:
+            lienzo = Image.new("RGB", self.tamano, "white")
+            lienzo.paste(rgb, (0, 0))
+            rgb = lienzo
+
+        transparente = False
+        if self.anterior is None:
+            caja = (0, 0) + self.tamano
+            recorte = rgb.quantize(palette=self.paleta, dither=Image.Dither.NONE)
+            self.indices = np.array(recorte)
+        else:
+            # Solo la región que cambió; si no cambió nada se repite un píxel
+            caja = ImageChops.difference(rgb, self.anterior).getbbox() or (0, 0, 1, 1)
+            recorte = rgb.crop(caja).quantize(palette=self.paleta, dither=Image.Dither.NONE)
+            x0, y0, x1, y1 = caja
+            indices = np.array(recorte)
+            # Los píxeles que quedan con el mismo índice de paleta que en el frame anterior
+            # se marcan como transparentes
+            iguales = indices == self.indices[y0:y1, x0:x1]
+            self.indices[y0:y1, x0:x1] = indices
+            if iguales.any():
+                indices[iguales] = INDICE_TRANSPARENTE
+                recorte = Image.fromarray(indices, mode="P")
+                recorte.putpalette(self.paleta.getpalette())
+                transparente = True
+        self.anterior = rgb
+        self.n_frames += 1
+        return caja, recorte, transparente
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        if tipo is None:
+            self.cerrar()
+        else:
+            self.fp.close()
+            os.remove(self.ruta_tmp)
+
+class EscritorGif(_EscritorIndexado):
+    def __init__(self, ruta, tamano, paleta, duracion_ms=300, loop=0):
+        super().__init__(ruta, tamano, paleta, duracion_ms)
+        ancho, alto = tamano
+        # Cabecera GIF89a con tabla de color global de 256 entradas y bucle NETSCAPE
+        self.fp.write(b"GIF89a" + struct.pack("<HHBBB", ancho, alto, 0xF7, 0, 0))
+        self.fp.write(bytes(paleta.getpalette()[:768]))
+        self.fp.write(b"!\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack("<H", loop) + b"\x00")
+
+    def agregar(self, frame):
+        caja, recorte, transparente = self._delta(frame)
+        parametros = {"duration": self.duracion_ms, "disposal": 1}
+        if transparente:
+            parametros["transparency"] = INDICE_TRANSPARENTE
+        for bloque in GifImagePlugin.getdata(recorte, offset=caja[:2], **parametros):
+            self.fp.write(bloque)
+
+    def cerrar(self):
+        self.fp.write(b";")
+        self.fp.close()
+        os.replace(self.ruta_tmp, self.ruta)
+
+# APNG con la misma paleta global y regiones delta: dispose_op=NONE y blend_op=OVER, de
+# modo que los píxeles transparentes conservan el frame anterior. El número de frames se
+# escribe en la cabecera (acTL), así que hay que conocerlo de antemano.
+class EscritorApng(_EscritorIndexado):
+    def __init__(self, ruta, tamano, paleta, n_frames, duracion_ms=300, loop=0):
+        super().__init__(ruta, tamano, paleta, duracion_ms)
+        self.secuencia = 0
+        ancho, alto = tamano
+        self.fp.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", ancho, alto, 8, 3, 0, 0, 0))
+        self._chunk(b"acTL", struct.pack(">II", n_frames, loop))
+        self._chunk(b"PLTE", bytes(paleta.getpalette()[:768]))
+        self._chunk(b"tRNS", bytes([255] * INDICE_TRANSPARENTE + [0]))
+
+    def _chunk(self, tipo, datos):
+        self.fp.write(struct.pack(">I", len(datos)) + tipo + datos)
+        self.fp.write(struct.pack(">I", zlib.crc32(tipo + datos) & 0xFFFFFFFF))
+
+    # Datos comprimidos (IDAT) de la región, codificada por Pillow como PNG indexado
+    @staticmethod
+    def _idat(recorte):
+        buffer = io.BytesIO()
+        recorte.save(buffer, format="PNG", bits=8)
+        png = buffer.getvalue()
+        datos, pos = [], 8
+        while pos < len(png):
+            longitud, tipo = struct.unpack(">I4s", png[pos:pos + 8])
+            if tipo == b"IDAT":
+                datos.append(png[pos + 8:pos + 8 + longitud])
+            pos += 12 + longitud
+        return b"".join(datos)
+
+    def agregar(self, frame):
+        primero = self.anterior is None
+        caja, recorte, _ = self._delta(frame)
+        x0, y0, x1, y1 = caja
+        self._chunk(b"fcTL", struct.pack(">IIIIIHHBB", self.secuencia, x1 - x0, y1 - y0, x0, y0,
+                                         self.duracion_ms, 1000, 0, 0 if primero else 1))
+        self.secuencia += 1
+        datos = self._idat(recorte)
+        if primero:
+            self._chunk(b"IDAT", datos)
+        else:
+            self._chunk(b"fdAT", struct.pack(">I", self.secuencia) + datos)
+            self.secuencia += 1
+
+    def cerrar(self):
+        self._chunk(b"IEND", b"")
+        self.fp.close()
+        os.replace(self.ruta_tmp, self.ruta)
+
+# Crea un GIF a partir de una secuencia de frames (rutas o imágenes PIL) sin cargarlos todos
+def escribir_gif(ruta_gif, frames, duracion_ms=300, colores_fijos=(), muestras=MUESTRAS_PALETA):
+    frames = list(frames)
+    if not frames:
+        return 0
+    indices = sorted({round(k * (len(frames) - 1) / max(muestras - 1, 1)) for k in range(muestras)})
+    paleta = calcular_paleta([frames[k] for k in indices], colores_fijos)
+    tamano = _abrir_rgb(frames[0]).size
+    with EscritorGif(ruta_gif, tamano, paleta, duracion_ms) as escritor:
+        for frame in frames:
+            escritor.agregar(frame)
+    return escritor.n_frames
+
+# Igual que escribir_gif pero en APNG
+def escribir_apng(ruta_apng, frames, duracion_ms=300, colores_fijos=(), muestras=MUESTRAS_PALETA):
+    frames = list(frames)
+    if not frames:
+        return 0
+    indices = sorted({round(k * (len(frames) - 1) / max(muestras - 1, 1)) for k in range(muestras)})
+    paleta = calcular_paleta([frames[k] for k in indices], colores_fijos)
+    tamano = _abrir_rgb(frames[0]).size
+    with EscritorApng(ruta_apng, tamano, paleta, len(frames), duracion_ms) as escritor:
+        for frame in frames:
+            escritor.agregar(frame)
+    return escritor.n_frames
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import resource
+import threading
+import contextlib
+from collections import defaultdict
+
+# === Métricas de tiempos y recursos por etapa ===
+# Cada etapa (descarga, lectura, graficado, GIF, ZIP, envío) registra tiempo de pared,
+# tiempo de CPU y RSS máximo; cada frame registra lo mismo desde su worker; las
+# transferencias registran los bytes. Al final de la ejecución `escribir` deja un
+# archivo JSON lines (historial, se agrega) y un textfile de Prometheus (se reemplaza)
+# junto a las imágenes.
+#
+# El tiempo de CPU de una etapa es el del proceso completo (incluidos los hijos
+# terminados) durante la etapa, así que en etapas que se solapan en hilos distintos
+# se cuenta más de una vez.
+
+_registros = []
+_candado = threading.Lock()
+_inicio = time.time()
+
+# RSS máximo de este proceso (o de sus hijos con RUSAGE_CHILDREN) en bytes
+def rss_max_bytes(quien=resource.RUSAGE_SELF):
+    # ru_maxrss está en KiB en Linux
+    return resource.getrusage(quien).ru_maxrss * 1024
+
+def _cpu_total():
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+def _agregar(registro):
+    registro["ts"] = round(time.time(), 3)
+    with _candado:
+        _registros.append(registro)
+
+def reiniciar():
+    global _inicio
+    with _candado:
+        _registros.clear()
+        _inicio = time.time()
+
+def registros():
+    with _candado:
+        return list(_registros)
+
+@contextlib.contextmanager
+def etapa(nombre, **etiquetas):
+    t0, cpu0 = time.perf_counter(), _cpu_total()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        registro = {
+            "tipo": "etapa", "nombre": nombre, "etiquetas": etiquetas,
+            "segundos": round(time.perf_counter() - t0, 4),
+            "cpu_segundos": round(_cpu_total() - cpu0, 4),
+            "rss_max_bytes": rss_max_bytes(),
+        }
+        if error:
+            registro["error"] = error
+        _agregar(registro)
+
+# Etapa medida por fuera de un bloque `with` (p. ej. desde que se encola hasta que termina)
+def registrar_etapa(nombre, segundos, cpu_segundos=0.0, **etiquetas):
+    _agregar({"tipo": "etapa", "nombre": nombre, "etiquetas": etiquetas, "segundos": round(segundos, 4),
+              "cpu_segundos": round(cpu_segundos, 4), "rss_max_bytes": rss_max_bytes()})
+
+def contar_bytes(direccion, n_bytes, **etiquetas):
+    _agregar({"tipo": "bytes", "nombre": direccion, "etiquetas": etiquetas, "bytes": int(n_bytes)})
+
+# Medición de un frame dentro del worker: devuelve el diccionario que el worker regresa
+# al proceso principal, que lo registra con `registrar_frame`
+@contextlib.contextmanager
+def medir_frame(resultado):
+    t0, cpu0 = time.perf_counter(), time.process_time()
+    yield resultado
+    resultado["segundos"] = round(time.perf_counter() - t0, 4)
+    resultado["cpu_segundos"] = round(time.process_time() - cpu0, 4)
+    resultado["rss_max_bytes"] = rss_max_bytes()
+    resultado["pid"] = os.getpid()
+
+def registrar_frame(medicion, **etiquetas):
+    _agregar({"tipo": "frame", "nombre": "frame", "etiquetas": etiquetas, **medicion})
+
+# === Salida ===
+def _etiquetas_prom(etiquetas):
+    if not etiquetas:
+        return ""
+    pares = ",".join(f'{k}="{str(v).replace(chr(34), "")}"' for k, v in sorted(etiquetas.items()))
+    return "{" + pares + "}"
+
+def texto_prometheus(lista=None):
+    lista = registros() if lista is None else lista
+    lineas = []
+
+    def metrica(nombre, tipo, ayuda, muestras):
+        if not muestras:
+            return
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+        for etiquetas, valor in muestras:
+            lineas.append(f"{nombre}{_etiquetas_prom(etiquetas)} {valor}")
+
+    etapas = [r for r in lista if r["tipo"] == "etapa"]
+    # Las etapas repetidas con las mismas etiquetas se suman
+    acumulado = defaultdict(lambda: [0.0, 0.0, 0])
+    for r in etapas:
+        clave = tuple(sorted({"etapa": r["nombre"], **r["etiquetas"]}.items()))
+        acumulado[clave][0] += r["segundos"]
+        acumulado[clave][1] += r["cpu_segundos"]
+        acumulado[clave][2] = max(acumulado[clave][2], r["rss_max_bytes"])
+    metrica("cams_etapa_segundos", "gauge", "Tiempo de pared por etapa",
+            [(dict(k), round(v[0], 4)) for k, v in acumulado.items()])
+    metrica("cams_etapa_cpu_segundos", "gauge", "Tiempo de CPU del proceso durante la etapa",
+            [(dict(k), round(v[1], 4)) for k, v in acumulado.items()])
+    metrica("cams_etapa_rss_max_bytes", "gauge", "RSS máximo del proceso al terminar la etapa",
+            [(dict(k), v[2]) for k, v in acumulado.items()])
+
+    frames = defaultdict(list)
+    for r in lista:
+        if r["tipo"] == "frame":
+            frames[tuple(sorted(r["etiquetas"].items()))].append(r)
+    metrica("cams_frame_segundos_sum", "gauge", "Suma del tiempo de graficado por frame",
+            [(dict(k), round(sum(f["segundos"] for f in v), 4)) for k, v in frames.items()])
+    metrica("cams_frame_segundos_max", "gauge", "Tiempo máximo de graficado de un frame",
+            [(dict(k), max(f["segundos"] for f in v)) for k, v in frames.items()])
+    metrica("cams_frame_cpu_segundos_sum", "gauge", "Suma del tiempo de CPU por frame",
+            [(dict(k), round(sum(f["cpu_segundos"] for f in v), 4)) for k, v in frames.items()])
+    metrica("cams_frames_total", "gauge", "Frames graficados",
+            [(dict(k), len(v)) for k, v in frames.items()])
+    metrica("cams_worker_rss_max_bytes", "gauge", "RSS máximo de los workers de graficado",
+            [(dict(k), max(f["rss_max_bytes"] for f in v)) for k, v in frames.items()])
+
+    transferidos = defaultdict(int)
+    for r in lista:
+        if r["tipo"] == "bytes":
+            transferidos[tuple(sorted({"direccion": r["nombre"], **r["etiquetas"]}.items()))] += r["bytes"]
+    metrica("cams_bytes_total", "gauge", "Bytes descargados o enviados",
+            [(dict(k), v) for k, v in transferidos.items()])
+
+    metrica("cams_ultima_ejecucion_timestamp_segundos", "gauge", "Fin de la última ejecución",
+            [({}, round(time.time(), 3))])
+    return "\n".join(lineas) + "\n"
+
+def escribir(directorio, nombre="metricas_cams"):
+    lista = registros()
+    os.makedirs(directorio, exist_ok=True)
+    ejecucion = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(_inicio))
+    with open(os.path.join(directorio, f"{nombre}.jsonl"), "a", encoding="utf-8") as f:
+        for r in lista:
+            f.write(json.dumps({"ejecucion": ejecucion, **r}, ensure_ascii=False) + "\n")
+
+    # El textfile collector de node_exporter lee *.prom; se reemplaza de forma atómica
+    ruta_prom = os.path.join(directorio, f"{nombre}.prom")
+    with open(f"{ruta_prom}.tmp", "w", encoding="utf-8") as f:
+        f.write(texto_prometheus(lista))
+    os.replace(f"{ruta_prom}.tmp", ruta_prom)
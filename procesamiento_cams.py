@@ -1,74 +1,75 @@
 import os
+import sys
+import time
+import cProfile
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import xarray as xr
-import geopandas as gpd
-import matplotlib.pyplot as plt
-import matplotlib.image as image
-import cartopy.crs as ccrs
-from matplotlib.colors import ListedColormap
-import subprocess
 import re
 import zipfile
-from PIL import Image
+from collections import OrderedDict
 from multiprocessing import Pool
+from cache_geometria import cargar_geometria, dibujar_geometria
+import cache_frames
+import envio_cams
+import gif_cams
+import datos_cams
+import metricas_cams
+import raster_cams
+import registro_cams
+import salida_cams
+
+# xarray, matplotlib y cartopy se importan dentro de las funciones que los usan, para
+# que sincronizar o descargar (cams.py) no paguen el costo de importarlos
 
 # === Directorios de entrada/salida ===
 DATA_DIR = "/home/arw/cams/temp/"
 IMG_DIR = "/home/arw/cams/imagery/"
 DESTINO = "arw@192.168.4.20:/var/www/html/salidaschem"
 
-# Crear carpeta de imágenes y eliminar archivos PNG antiguos
-os.makedirs(IMG_DIR, exist_ok=True)
-for f in os.listdir(IMG_DIR):
-    if f.startswith("cams_") and f.endswith(".png"):
-        os.remove(os.path.join(IMG_DIR, f))
-
-# === Lectura de archivos netCDF de superficie y niveles de presión ===
-ds_sfc = xr.open_dataset(os.path.join(DATA_DIR, "data_sfc_polvo.nc"))
-ds_plev = xr.open_dataset(os.path.join(DATA_DIR, "data_plev_polvo.nc"))
-ds_sfc_aod = xr.open_dataset(os.path.join(DATA_DIR, "data_sfc_aod.nc"))
-
-# === Procesamiento de tiempos de las variables ===
-aod = ds_sfc_aod["duaod550"].values.squeeze()
-tiempo_sfc_aod = ds_sfc_aod.forecast_reference_time.values[0] + ds_sfc_aod.forecast_period.values
-tiempo_sfc_aod_str = [np.datetime_as_string(t - np.timedelta64(6, 'h'), unit='m') for t in tiempo_sfc_aod]
-
-lat_aod = ds_sfc_aod.latitude.values
-lon_aod = ds_sfc_aod.longitude.values
-X_aod, Y_aod = np.meshgrid(lon_aod, lat_aod)
-
-lat = ds_sfc.latitude.values
-lon = ds_sfc.longitude.values
-X, Y = np.meshgrid(lon, lat)
-
-tiempo_sfc = ds_sfc.forecast_reference_time.values[0] + ds_sfc.forecast_period.values
-tiempo_plev = ds_plev.forecast_reference_time.values[0] + ds_plev.forecast_period.values
-
-tiempo_sfc_str = [np.datetime_as_string(t - np.timedelta64(6, 'h'), unit='m') for t in tiempo_sfc]
-tiempo_plev_str = [np.datetime_as_string(t - np.timedelta64(6, 'h'), unit='m') for t in tiempo_plev]
-
-# === Variables a graficar y procesamiento adicional ===
-pm10 = ds_sfc.pm10.values.squeeze() * 1e9
-pm25 = ds_sfc.pm2p5.values.squeeze() * 1e9
-rho_aire = 1.225  # kg/m3
-
-# Conversión de polvo total a concentración usando densidad del aire y escalamiento
-# Se descarta todo valor <= 0 para evitar errores en los gráficos
-dust_total = (
-    ds_plev["aermr04"].sel(pressure_level=1000).values +
-    ds_plev["aermr05"].sel(pressure_level=1000).values +
-    ds_plev["aermr06"].sel(pressure_level=1000).values
-).squeeze() * rho_aire * 1e9
-
-dust_total = np.where(dust_total <= 0, np.nan, dust_total)
-
-# === Carga de shapefiles y logos ===
-shp1 = gpd.read_file("/home/arw/shape/GSHHS_h_L1.shp")
-shp2 = gpd.read_file("/home/arw/shape/ESA_CA_wgs84.shp")
-shp3 = gpd.read_file("/home/arw/shape/El_Salvador_departamentos.shp")
-logo = image.imread("/home/arw/scripts/python/cams/logoMarn_color.png")
-icca = image.imread("/home/arw/scripts/python/cams/ICCA.jpeg")
+# Geometrías y logos
+SHP_COSTAS = "/home/arw/shape/GSHHS_h_L1.shp"
+# Costa de baja resolución para la vista amplia de AOD (si no existe se usa SHP_COSTAS)
+SHP_COSTAS_AOD = "/home/arw/shape/GSHHS_l_L1.shp"
+SHP_PAISES = "/home/arw/shape/ESA_CA_wgs84.shp"
+SHP_DEPARTAMENTOS = "/home/arw/shape/El_Salvador_departamentos.shp"
+RUTA_LOGO = "/home/arw/scripts/python/cams/logoMarn_color.png"
+RUTA_ICCA = "/home/arw/scripts/python/cams/ICCA.jpeg"
+RESOLUCION_MAPA = 1200  # ancho en píxeles de las figuras (12 pulgadas a 100 dpi)
+
+# Procesos del pool de graficado (uno por CPU por defecto)
+NUM_WORKERS = os.cpu_count() or 4
+
+# Reutilizar el mapa base en cada worker y redibujar solo los contornos por frame
+USAR_PLANTILLA = True
+
+# Graficar los productos de PM (ICCA y continuos) como raster por clases de color
+# (raster_cams) en lugar de contourf
+RASTER_PM = False
+
+# Modo reducido del AOD: el campo se promedia por área hasta la resolución de salida
+# (solo si la malla es más fina que los píxeles del mapa), se grafica como raster por
+# clases y la costa usa SHP_COSTAS_AOD sin islas menores a MINIMO_PX_AOD píxeles. El
+# costo por frame depende del tamaño de la imagen y no de la malla de entrada.
+AOD_REDUCIDO = False
+MINIMO_PX_AOD = 2
+
+# Formato de los frames (ver salida_cams): "png" recortado con GIF y ZIP, o "webp"/"png8"
+# a tamaño fijo con animación APNG, ZIP y manifiesto JSON para el visor web
+FORMATO_FRAMES = "png"
+
+# Productos a procesar (None = todos los de definir_productos)
+PRODUCTOS = None
+
+# Programa de frames: segmentos [hasta_h, paso_h] sobre el plazo en horas, p. ej.
+# [[48, 1], [120, 3]] = horario hasta 48 h y cada 3 h después. Los plazos fuera del
+# programa no se dibujan en la corrida nocturna; servicio_cams los dibuja la primera vez
+# que se piden. None = todos los plazos.
+PROGRAMA_FRAMES = None
+
+# Frames a perfilar con cProfile, p. ej. CAMS_PERFIL_FRAME="cams_pm10_icca_005,cams_aod_dust_001".
+# El perfil queda junto al PNG como <frame>.prof (se lee con `python -m pstats`).
+PERFIL_FRAME = {f.strip() for f in os.environ.get("CAMS_PERFIL_FRAME", "").split(",") if f.strip()}
 
 # === Niveles de color para los mapas ===
 niveles_pm10 = np.arange(0, 200, 1)
@@ -82,96 +83,321 @@ niveles_pm10_icca = [0, 56, 155, 255, 355, 424, 604]
 niveles_pm25_icca = [0, 15.5, 40.5, 66, 160, 251, 500]
 categorias = ["Buena", "Moderada", "Dañina\n sensibles", "Dañina\n salud", "Muy\n dañina", "Peligroso"]
 
-etiqueta_hora = f"Hora de creación: {datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')} (hora local)"
-
 # === Colormap personalizado: blanco para el primer valor ===
-original_cmap = plt.cm.get_cmap('YlOrBr', 256)
-polvo = original_cmap(np.linspace(0, 1, 256))
-polvo[0] = [1, 1, 1, 1]
-polvo_colores = ListedColormap(polvo)
+def colores_polvo():
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import ListedColormap
+
+    original_cmap = plt.get_cmap('YlOrBr', 256)
+    polvo = original_cmap(np.linspace(0, 1, 256))
+    polvo[0] = [1, 1, 1, 1]
+    return ListedColormap(polvo)
+
+# Subcarpeta de destino de cada producto en el servidor
+SUBCARPETAS = {
+    "cams_dust_total": "dust_cams",
+    "cams_aod_dust": "aod_cams",
+    "cams_pm10_icca": "pm10_cams_icca",
+    "cams_pm25_icca": "pm25_cams_icca",
+    "cams_pm10": "pm10_cams",
+    "cams_pm25": "pm25_cams",
+}
+
+def crear_etiqueta_hora():
+    return f"Hora de creación: {datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')} (hora local)"
 
-# === Función para crear animaciones GIF a partir de PNG ===
-def crear_gif(nombre_base, duracion=0.3):
-    # Regex que asegura coincidencia exacta: nombre_base + "_" + número.png
-    patron = re.compile(rf"^{re.escape(nombre_base)}_\d+\.png$")
+# === Lectura de archivos netCDF de superficie y niveles de presión ===
+# `etiqueta` permite leer un bloque de plazos descargado por separado (p. ej. "_024").
+# Los NetCDF se abren de forma perezosa y cada campo derivado se calcula plazo por plazo
+# hacia un .npy que los workers leen con mmap (ver datos_cams).
+NETCDF_DATOS = ("data_sfc_polvo", "data_plev_polvo", "data_sfc_aod")
+
+def abrir_datasets(data_dir=None, etiqueta=""):
+    import xarray as xr
+
+    data_dir = data_dir or DATA_DIR
+    return tuple(xr.open_dataset(os.path.join(data_dir, f"{nombre}{etiqueta}.nc")) for nombre in NETCDF_DATOS)
+
+# `datasets` permite pasar los datasets ya abiertos (ds_sfc, ds_plev, ds_sfc_aod)
+def cargar_datos(data_dir=None, etiqueta="", datasets=None):
+    data_dir = data_dir or DATA_DIR
+    with metricas_cams.etapa("lectura", bloque=etiqueta or "completo"):
+        ds_sfc, ds_plev, ds_sfc_aod = datasets if datasets is not None else abrir_datasets(data_dir, etiqueta)
+    dir_campos = os.path.join(data_dir, ".campos")
+
+    def ruta_campo(nombre):
+        return os.path.join(dir_campos, f"{nombre}{etiqueta}.npy")
+
+    # === Procesamiento de tiempos de las variables ===
+    tiempo_sfc_aod = ds_sfc_aod.forecast_reference_time.values[0] + ds_sfc_aod.forecast_period.values
+    tiempo_sfc_aod_str = [np.datetime_as_string(t - np.timedelta64(6, 'h'), unit='m') for t in tiempo_sfc_aod]
+
+    lat_aod = ds_sfc_aod.latitude.values
+    lon_aod = ds_sfc_aod.longitude.values
+    X_aod, Y_aod = np.meshgrid(lon_aod, lat_aod)
+
+    lat = ds_sfc.latitude.values
+    lon = ds_sfc.longitude.values
+    X, Y = np.meshgrid(lon, lat)
+
+    ciclo = np.datetime_as_string(ds_sfc.forecast_reference_time.values[0], unit='h')
+    tiempo_sfc = ds_sfc.forecast_reference_time.values[0] + ds_sfc.forecast_period.values
+    tiempo_plev = ds_plev.forecast_reference_time.values[0] + ds_plev.forecast_period.values
+
+    tiempo_sfc_str = [np.datetime_as_string(t - np.timedelta64(6, 'h'), unit='m') for t in tiempo_sfc]
+    tiempo_plev_str = [np.datetime_as_string(t - np.timedelta64(6, 'h'), unit='m') for t in tiempo_plev]
+
+    # === Variables a graficar y procesamiento adicional ===
+    rho_aire = 1.225  # kg/m3
+
+    def superficie(ds, variable, escala):
+        return lambda i: ds[variable].isel(forecast_period=i).values.squeeze() * escala
+
+    # Conversión de polvo total a concentración usando densidad del aire y escalamiento
+    # Se descarta todo valor <= 0 para evitar errores en los gráficos
+    def polvo_total(i):
+        plazo = ds_plev.isel(forecast_period=i).sel(pressure_level=1000)
+        dust = (
+            plazo["aermr04"].values +
+            plazo["aermr05"].values +
+            plazo["aermr06"].values
+        ).squeeze() * rho_aire * 1e9
+        return np.where(dust <= 0, np.nan, dust)
+
+    n_sfc = ds_sfc.sizes["forecast_period"]
+    n_plev = ds_plev.sizes["forecast_period"]
+    n_aod = ds_sfc_aod.sizes["forecast_period"]
+    with metricas_cams.etapa("campos_derivados", bloque=etiqueta or "completo"):
+        pm10 = datos_cams.materializar(ruta_campo("pm10"), n_sfc, superficie(ds_sfc, "pm10", 1e9))
+        pm25 = datos_cams.materializar(ruta_campo("pm25"), n_sfc, superficie(ds_sfc, "pm2p5", 1e9))
+        dust_total = datos_cams.materializar(ruta_campo("dust_total"), n_plev, polvo_total)
+        aod = datos_cams.materializar(ruta_campo("aod"), n_aod, superficie(ds_sfc_aod, "duaod550", 1))
+
+    for ds in (ds_sfc, ds_plev, ds_sfc_aod):
+        ds.close()
+
+    return {
+        "aod": aod, "tiempo_sfc_aod_str": tiempo_sfc_aod_str,
+        "lat_aod": lat_aod, "lon_aod": lon_aod,
+        "X_aod": datos_cams.compartir(ruta_campo("X_aod"), X_aod),
+        "Y_aod": datos_cams.compartir(ruta_campo("Y_aod"), Y_aod),
+        "lat": lat, "lon": lon,
+        "X": datos_cams.compartir(ruta_campo("X"), X), "Y": datos_cams.compartir(ruta_campo("Y"), Y),
+        "tiempo_sfc_str": tiempo_sfc_str, "tiempo_plev_str": tiempo_plev_str,
+        "pm10": pm10, "pm25": pm25, "dust_total": dust_total,
+        "dir_campos": dir_campos, "ciclo": ciclo,
+    }
 
-    ruta_imagenes = sorted([
-        os.path.join(IMG_DIR, f) for f in os.listdir(IMG_DIR)
-        if patron.fullmatch(f)
-    ])
+# === Carga de shapefiles y logos ===
+# Las geometrías se recortan y simplifican por extensión y se leen de la caché en disco;
+# los logos se comparten con los workers como .npy mapeados en memoria
+def cargar_recursos(datos):
+    with metricas_cams.etapa("recursos"):
+        return _cargar_recursos(datos)
+
+def _cargar_recursos(datos):
+    import matplotlib.image as image
+
+    extension_ca = [min(datos["lon"]), max(datos["lon"]), min(datos["lat"]), max(datos["lat"])]
+    extension_aod = [min(datos["lon_aod"]), max(datos["lon_aod"]), min(datos["lat_aod"]), max(datos["lat_aod"])]
+    return {
+        "shapefiles_ca": [cargar_geometria(r, extension_ca, RESOLUCION_MAPA)
+                          for r in (SHP_COSTAS, SHP_PAISES, SHP_DEPARTAMENTOS)],
+        "shapefiles_aod": _shapefiles_aod(extension_aod),
+        "logo": datos_cams.compartir(os.path.join(datos["dir_campos"], "logo.npy"), image.imread(RUTA_LOGO)),
+        "icca": datos_cams.compartir(os.path.join(datos["dir_campos"], "icca.npy"), image.imread(RUTA_ICCA)),
+    }
+
+def _shapefiles_aod(extension_aod):
+    if not AOD_REDUCIDO:
+        return [cargar_geometria(r, extension_aod, RESOLUCION_MAPA) for r in (SHP_COSTAS, SHP_PAISES)]
+    costas = SHP_COSTAS_AOD if os.path.exists(SHP_COSTAS_AOD) else SHP_COSTAS
+    return [cargar_geometria(r, extension_aod, RESOLUCION_MAPA, minimo_px=MINIMO_PX_AOD)
+            for r in (costas, SHP_PAISES)]
+
+# Regex que asegura coincidencia exacta: nombre_base + "_" + número + extensión del formato
+def _patron_frames(nombre_base):
+    return re.compile(rf"^{re.escape(nombre_base)}_(\d+)\.{salida_cams.extension(FORMATO_FRAMES)}$")
+
+def ruta_frame(nombre_archivo_base, n):
+    return f"{nombre_archivo_base}_{n:03}.{salida_cams.extension(FORMATO_FRAMES)}"
+
+def _frames_producto(nombre_base):
+    patron = _patron_frames(nombre_base)
+    return sorted(os.path.join(IMG_DIR, f) for f in os.listdir(IMG_DIR) if patron.fullmatch(f))
+
+# === Función para crear animaciones GIF a partir de los frames ===
+def crear_gif(nombre_base, duracion=0.3):
+    ruta_imagenes = _frames_producto(nombre_base)
     if not ruta_imagenes:
         print(f"⚠️ No se encontraron imágenes para {nombre_base} para crear GIF.")
         return
 
     ruta_gif = os.path.join(IMG_DIR, f"{nombre_base}.gif")
     print(f"🎞️ Generando GIF: {ruta_gif}")
-    frames = [Image.open(im) for im in ruta_imagenes]
-    frames[0].save(
-        ruta_gif,
-        format='GIF',
-        append_images=frames[1:],
-        save_all=True,
-        duration=int(duracion * 1000),
-        loop=0
-    )
+    # Los frames se leen de disco uno a uno con una paleta global por producto
+    # que siempre incluye los colores ICCA
+    with metricas_cams.etapa("gif", producto=nombre_base):
+        gif_cams.escribir_gif(ruta_gif, ruta_imagenes, duracion_ms=int(duracion * 1000),
+                              colores_fijos=paleta_icca)
+
+# === Animación APNG para los formatos de tamaño fijo ===
+def crear_apng(nombre_base, duracion=0.3):
+    ruta_imagenes = _frames_producto(nombre_base)
+    if not ruta_imagenes:
+        print(f"⚠️ No se encontraron imágenes para {nombre_base} para crear APNG.")
+        return
+    ruta_apng = os.path.join(IMG_DIR, f"{nombre_base}.apng")
+    print(f"🎞️ Generando APNG: {ruta_apng}")
+    with metricas_cams.etapa("apng", producto=nombre_base):
+        gif_cams.escribir_apng(ruta_apng, ruta_imagenes, duracion_ms=int(duracion * 1000),
+                               colores_fijos=paleta_icca)
+    return ruta_apng
+
+# === Crear ZIP con solo los frames correctos ===
+def crear_zip(nombre_base):
+    patron = _patron_frames(nombre_base)
+    ruta_zip = os.path.join(IMG_DIR, f"{nombre_base}.zip")
+    print(f"🗜️ Creando archivo ZIP: {ruta_zip}")
+    with metricas_cams.etapa("zip", producto=nombre_base), \
+            zipfile.ZipFile(ruta_zip, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for file in sorted(os.listdir(IMG_DIR)):
+            if patron.fullmatch(file):
+                zipf.write(os.path.join(IMG_DIR, file), arcname=file)
+    return ruta_zip
 
 # === Función para sincronizar imágenes y archivos al servidor ===
-def sincronizar(nombre_base, subcarpeta_destino):
-    # Compilar patrón exacto de nombre_base_###.png
-    patron = re.compile(rf"^{re.escape(nombre_base)}_\d+\.png$")
-
-    ruta_gif = os.path.join(IMG_DIR, f"{nombre_base}.gif")
+# `frames` limita el envío a esos números de frame (None = todos) y `empaquetar`
+# controla si se generan y envían el GIF y el ZIP del producto. Todo se sube en una
+# sola transferencia y el resultado queda en el registro de frames; devuelve True si el
+# envío terminó sin errores.
+def sincronizar(nombre_base, subcarpeta_destino, frames=None, empaquetar=True):
+    # Compilar patrón exacto de nombre_base_###.<ext>
+    patron = _patron_frames(nombre_base)
+    web = salida_cams.tamano_fijo(FORMATO_FRAMES)
+
+    ruta_animacion = os.path.join(IMG_DIR, f"{nombre_base}.apng" if web else f"{nombre_base}.gif")
     ruta_zip = os.path.join(IMG_DIR, f"{nombre_base}.zip")
+    ruta_manifiesto = os.path.join(IMG_DIR, f"{nombre_base}.json")
     destino = f"{DESTINO}/{subcarpeta_destino}/images"
 
-    # === Enviar PNGs válidos ===
-    print(f"📤 Enviando imágenes {nombre_base}_*.png a {subcarpeta_destino}...")
+    # === Frames válidos ===
+    archivos, numeros = [], []
     for file in sorted(os.listdir(IMG_DIR)):
-        if patron.fullmatch(file):
-            subprocess.run(f"scp {os.path.join(IMG_DIR, file)} {destino}", shell=True)
-
-    # === Crear y enviar GIF ===
-    crear_gif(nombre_base)
-    if os.path.exists(ruta_gif):
-        print(f"📤 Enviando GIF {nombre_base}.gif a {subcarpeta_destino}...")
-        subprocess.run(f"scp {ruta_gif} {destino}", shell=True)
-
-    # === Crear ZIP con solo los PNG correctos ===
-    print(f"🗜️ Creando archivo ZIP: {ruta_zip}")
-    with zipfile.ZipFile(ruta_zip, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for file in sorted(os.listdir(IMG_DIR)):
-            if patron.fullmatch(file):
-                zipf.write(os.path.join(IMG_DIR, file), arcname=file)
+        coincidencia = patron.fullmatch(file)
+        if coincidencia and (frames is None or int(coincidencia.group(1)) in frames):
+            archivos.append(os.path.join(IMG_DIR, file))
+            numeros.append(int(coincidencia.group(1)))
+
+    if empaquetar:
+        # === Crear GIF (o APNG) ===
+        if web:
+            crear_apng(nombre_base)
+        else:
+            crear_gif(nombre_base)
+
+        crear_zip(nombre_base)
+
+        archivos += [r for r in (ruta_animacion, ruta_zip) if os.path.exists(r)]
+
+    # El manifiesto va al final para que el visor no liste frames que aún no llegaron
+    if web and os.path.exists(ruta_manifiesto):
+        archivos.append(ruta_manifiesto)
+
+    if not archivos:
+        return True
+    print(f"📤 Enviando {len(archivos)} archivos de {nombre_base} a {subcarpeta_destino}...")
+    with metricas_cams.etapa("envio", producto=nombre_base):
+        ok = envio_cams.subir(archivos, destino)
+    registro_cams.marcar_envio(IMG_DIR, nombre_base, numeros, ok)
+    if ok:
+        # Bytes ofrecidos a la transferencia (rsync puede enviar menos)
+        metricas_cams.contar_bytes("envio", sum(os.path.getsize(r) for r in archivos), producto=nombre_base)
+    return ok
+
+# === Plantillas de mapa base reutilizables por worker ===
+# Cada proceso construye una sola vez la parte estática del mapa (costas, fronteras,
+# cuadrícula, logos, barra de color y pie de página) y en cada frame solo cambia
+# el relleno de contornos y el título. Cada plantilla guarda el contexto con el que se
+# construyó (pie de página con la hora de creación, extensión y malla): si cambia, p. ej.
+# porque el servicio bajo demanda recargó los datos de otro ciclo, la figura anterior se
+# cierra y se reconstruye. Cada worker conserva a lo sumo MAX_PLANTILLAS; al pasar de
+# ese número se cierra la usada hace más tiempo, para no acumular figuras de pyplot.
+MAX_PLANTILLAS = 8
+
+# (nombre_archivo_base, modo) -> (contexto, figura, plantilla), del uso más antiguo al más reciente
+_plantillas = OrderedDict()
+
+def _contexto_plantilla(X, lat, lon, etiqueta_hora, formato):
+    return (etiqueta_hora, float(min(lat)), float(max(lat)), float(min(lon)), float(max(lon)),
+            np.shape(X), formato)
+
+def _plantilla(clave, contexto):
+    import matplotlib.pyplot as plt
+
+    entrada = _plantillas.get(clave)
+    if entrada is None:
+        return None
+    if entrada[0] != contexto:
+        del _plantillas[clave]
+        plt.close(entrada[1])
+        return None
+    _plantillas.move_to_end(clave)
+    return entrada[2]
+
+def _guardar_plantilla(clave, contexto, fig, plantilla):
+    import matplotlib.pyplot as plt
+
+    _plantillas[clave] = (contexto, fig, plantilla)
+    while len(_plantillas) > MAX_PLANTILLAS:
+        plt.close(_plantillas.popitem(last=False)[1][1])
+    return plantilla
+
+# Cierra todas las plantillas del proceso (servicio_cams al recargar los datos)
+def cerrar_plantillas():
+    import matplotlib.pyplot as plt
+
+    while _plantillas:
+        plt.close(_plantillas.popitem()[1][1])
+
+def _eliminar_contorno(cont):
+    try:
+        cont.remove()
+    except (AttributeError, NotImplementedError):
+        # Matplotlib < 3.8: ContourSet no es un Artist
+        for c in cont.collections:
+            c.remove()
+
+def _dibujar_contorno(ax, X, Y, variable_i, cmap, niveles, usar_icca, niveles_icca, zorder=None):
+    import cartopy.crs as ccrs
 
-    # === Enviar ZIP al servidor ===
-    if os.path.exists(ruta_zip):
-        print(f"📤 Enviando ZIP {nombre_base}.zip a {subcarpeta_destino}...")
-        subprocess.run(f"scp {ruta_zip} {destino}", shell=True)
+    cont = ax.contourf(X, Y, variable_i, levels=niveles,
+                       cmap=cmap if not usar_icca else None,
+                       colors=cmap if usar_icca else None,
+                       extend="both", transform=ccrs.PlateCarree(), zorder=zorder)
+    if usar_icca and niveles_icca:
+        cont.set_clim(min(niveles_icca), max(niveles_icca))
+    return cont
 
-# === Función paralela para graficar un solo frame ===
-def graficar_frame(args):
-    (i, variable_i, tiempo_i, X, Y, lat, lon, logo, etiqueta_hora, cmap, niveles,
-     nombre_variable, nombre_archivo_base, usar_icca, icca_img, niveles_icca,
-     categorias, shapefiles, shrink_colorbar) = args
+def _construir_mapa(variable_i, X, Y, lat, lon, logo, etiqueta_hora, cmap, niveles,
+                    usar_icca, icca_img, niveles_icca, categorias, shapefiles, shrink_colorbar,
+                    zorder_contorno=None):
+    import matplotlib.pyplot as plt
+    import cartopy.crs as ccrs
 
     fig = plt.figure(figsize=(12, 12 / ((max(lon) - min(lon)) / (max(lat) - min(lat)))), dpi=100)
     ax = plt.axes(projection=ccrs.PlateCarree())
     ax.set_extent([min(lon), max(lon), min(lat), max(lat)], crs=ccrs.PlateCarree())
 
-    cont = ax.contourf(X, Y, variable_i, levels=niveles,
-                       cmap=cmap if not usar_icca else None,
-                       colors=cmap if usar_icca else None,
-                       extend="both", transform=ccrs.PlateCarree())
+    cont = _dibujar_contorno(ax, X, Y, variable_i, cmap, niveles, usar_icca, niveles_icca, zorder_contorno)
 
     cbar = plt.colorbar(cont, ax=ax, orientation='horizontal', pad=0.08, shrink=shrink_colorbar, extendrect=True)
     cbar.outline.set_linewidth(0.5)
     if usar_icca and categorias:
-        cont.set_clim(min(niveles_icca), max(niveles_icca))
         ticks_icca = [(niveles_icca[i] + niveles_icca[i+1]) / 2 for i in range(len(niveles_icca)-1)]
         cbar.set_ticks(ticks_icca)
         cbar.set_ticklabels(categorias)
 
-    ax.set_title(f"{nombre_variable} - {tiempo_i} (hora local)\nModelo CAMS - Observatorio de Amenazas - MARN", fontsize=12, pad=15)
     ax.set_xlabel("Longitud", fontsize=11)
     ax.set_ylabel("Latitud", fontsize=11)
 
@@ -180,8 +406,8 @@ def graficar_frame(args):
     gl.linestyle = '--'
     gl.color = 'gray'
 
-    for shp in shapefiles:
-        shp.plot(ax=ax, edgecolor='black', facecolor='none', linewidth=0.5, transform=ccrs.PlateCarree())
+    for trazos in shapefiles:
+        dibujar_geometria(ax, trazos, transform=ccrs.PlateCarree())
 
     logo_height = (max(lat) - min(lat)) * 0.12
     logo_width = (logo.shape[1] / logo.shape[0]) * logo_height
@@ -195,59 +421,378 @@ def graficar_frame(args):
                   transform=ccrs.PlateCarree(), zorder=10)
 
     fig.text(0.5, 0.01, etiqueta_hora, fontsize=7, ha='center')
-    plt.tight_layout()
-    fig.savefig(f"{nombre_archivo_base}_{i+1:03}.png", bbox_inches='tight')
-    plt.close()
+    return fig, ax, cont
 
-# === Función principal de graficado con paralelización por frame ===
-def graficar_variable(variable, tiempos, X, Y, lat, lon, logo, etiqueta_hora, cmap, niveles,
-                      nombre_variable, nombre_archivo_base, icca=None, niveles_icca=None,
-                      categorias=None, usar_icca=False, shapefiles=[], shrink_colorbar=0.4):
+def _titulo(nombre_variable, tiempo_i):
+    return f"{nombre_variable} - {tiempo_i} (hora local)\nModelo CAMS - Observatorio de Amenazas - MARN"
 
+# === Función paralela para graficar un solo frame ===
+# Devuelve la medición del frame (tiempo, CPU y RSS del worker) para metricas_cams
+def graficar_frame(args):
+    i, nombre_archivo_base = args[0], args[12]
+    nombre_frame = f"{os.path.basename(nombre_archivo_base)}_{i+1:03}"
+    with metricas_cams.medir_frame({"frame": i + 1}) as medicion:
+        if nombre_frame in PERFIL_FRAME:
+            perfil = cProfile.Profile()
+            perfil.runcall(_graficar_frame, args)
+            perfil.dump_stats(f"{nombre_archivo_base}_{i+1:03}.prof")
+        else:
+            _graficar_frame(args)
+    return medicion
+
+# Versión para el pool: los errores se devuelven en lugar de propagarse, para que un frame
+# fallido no haga perder los resultados del resto. Devuelve (frame, medición, error).
+def _graficar_frame_seguro(args):
+    try:
+        return args[0] + 1, graficar_frame(args), None
+    except Exception as e:
+        return args[0] + 1, None, f"{type(e).__name__}: {e}"
+
+def _graficar_frame(args):
+    import matplotlib.pyplot as plt
+
+    (i, variable_i, tiempo_i, X, Y, lat, lon, logo, etiqueta_hora, cmap, niveles,
+     nombre_variable, nombre_archivo_base, usar_icca, icca_img, niveles_icca,
+     categorias, shapefiles, shrink_colorbar, usar_plantilla, usar_raster, formato) = args
+    ruta = f"{nombre_archivo_base}_{i+1:03}.{salida_cams.extension(formato)}"
+
+    # Los campos llegan como referencias a .npy compartidos; aquí se leen vía mmap
+    variable_i, X, Y, logo = (np.asarray(a) for a in (variable_i, X, Y, logo))
+    if icca_img is not None:
+        icca_img = np.asarray(icca_img)
+
+    contexto = _contexto_plantilla(X, lat, lon, etiqueta_hora, formato)
+    if usar_raster:
+        plantilla = _plantilla((nombre_archivo_base, "raster"), contexto)
+        if plantilla is None:
+            # El contorno de un campo nulo solo sirve para construir la barra de color
+            fig, ax, cont = _construir_mapa(np.zeros(X.shape), X, Y, lat, lon, logo, etiqueta_hora, cmap,
+                                            niveles, usar_icca, icca_img, niveles_icca, categorias,
+                                            shapefiles, shrink_colorbar)
+            _eliminar_contorno(cont)
+            titulo = ax.set_title(_titulo(nombre_variable, tiempo_i), fontsize=12, pad=15)
+            plt.figure(fig.number)
+            plt.tight_layout()
+            plantilla = _guardar_plantilla((nombre_archivo_base, "raster"), contexto, fig, raster_cams.PlantillaRaster(
+                fig, ax, titulo, lat, lon, raster_cams.tabla_colores(cmap, niveles, usar_icca),
+                recortar=not salida_cams.tamano_fijo(formato)))
+        # Solo se clasifica el plazo de este frame, refinado según los píxeles por celda
+        clases = raster_cams.clasificar(variable_i, niveles, plantilla.factor)
+        plantilla.guardar(clases, _titulo(nombre_variable, tiempo_i), ruta, formato)
+        return
+
+    if not usar_plantilla:
+        fig, ax, cont = _construir_mapa(variable_i, X, Y, lat, lon, logo, etiqueta_hora, cmap, niveles,
+                                        usar_icca, icca_img, niveles_icca, categorias, shapefiles,
+                                        shrink_colorbar)
+        ax.set_title(_titulo(nombre_variable, tiempo_i), fontsize=12, pad=15)
+        plt.tight_layout()
+        salida_cams.guardar_figura(fig, ruta, formato)
+        plt.close(fig)
+        return
+
+    plantilla = _plantilla((nombre_archivo_base, "contorno"), contexto)
+    if plantilla is None:
+        # El contorno queda por debajo de las líneas de los shapefiles y la cuadrícula,
+        # igual que cuando se dibuja primero en el modo sin plantilla
+        fig, ax, cont = _construir_mapa(variable_i, X, Y, lat, lon, logo, etiqueta_hora, cmap, niveles,
+                                        usar_icca, icca_img, niveles_icca, categorias, shapefiles,
+                                        shrink_colorbar, zorder_contorno=0.5)
+        titulo = ax.set_title(_titulo(nombre_variable, tiempo_i), fontsize=12, pad=15)
+        plt.figure(fig.number)
+        plt.tight_layout()
+        plantilla = _guardar_plantilla((nombre_archivo_base, "contorno"), contexto, fig,
+                                       {"fig": fig, "ax": ax, "cont": cont, "titulo": titulo})
+    else:
+        _eliminar_contorno(plantilla["cont"])
+        plantilla["cont"] = _dibujar_contorno(plantilla["ax"], X, Y, variable_i, cmap, niveles,
+                                              usar_icca, niveles_icca, zorder=0.5)
+        plantilla["titulo"].set_text(_titulo(nombre_variable, tiempo_i))
+
+    salida_cams.guardar_figura(plantilla["fig"], ruta, formato)
+
+# === Programa de frames ===
+def en_programa(plazo, programa=None):
+    programa = PROGRAMA_FRAMES if programa is None else programa
+    if not programa:
+        return True
+    paso = next((paso for hasta, paso in programa if plazo <= hasta), programa[-1][1])
+    return plazo % paso == 0
+
+# === Argumentos de los frames de un producto ===
+# Devuelve la lista de argumentos de graficar_frame (uno por plazo) y la huella de estilo
+# para la caché de frames
+def preparar_frames(variable, tiempos, X, Y, lat, lon, logo, etiqueta_hora, cmap, niveles,
+                    nombre_variable, nombre_archivo_base, icca=None, niveles_icca=None,
+                    categorias=None, usar_icca=False, shapefiles=[], shrink_colorbar=0.4,
+                    usar_plantilla=None, indice_inicial=0, usar_raster=False):
+
+    # USAR_PLANTILLA se lee aquí y no como valor por defecto para que cams.py pueda cambiarlo
+    if usar_plantilla is None:
+        usar_plantilla = USAR_PLANTILLA
+    estilo = [lat, lon, niveles, cmap, usar_icca, niveles_icca, categorias, shapefiles, shrink_colorbar,
+              icca is not None]
+    if usar_raster:
+        # Cada worker clasifica solo los plazos que grafica (ver _graficar_frame)
+        estilo.append(("raster", raster_cams.SUBMUESTREO))
+    if FORMATO_FRAMES != "png":
+        estilo.append(("formato", FORMATO_FRAMES))
+
+    # El número de frame corresponde al plazo de pronóstico (indice_inicial + i)
     args = [
-        (i, variable[i], tiempos[i], X, Y, lat, lon, logo, etiqueta_hora, cmap, niveles,
-         nombre_variable, nombre_archivo_base, usar_icca, icca, niveles_icca, categorias, shapefiles, shrink_colorbar)
+        (indice_inicial + i, variable[i], tiempos[i], X, Y, lat, lon, logo, etiqueta_hora, cmap, niveles,
+         nombre_variable, nombre_archivo_base, usar_icca, icca, niveles_icca, categorias, shapefiles, shrink_colorbar,
+         usar_plantilla, usar_raster, FORMATO_FRAMES)
         for i in range(min(variable.shape[0], len(tiempos)))
     ]
+    return args, cache_frames.huella_estilo(*estilo)
+
+# Clave de caché de un frame a partir de sus argumentos de graficar_frame
+def clave_frame(huella, args):
+    return cache_frames.clave_frame(huella, args[1], _titulo(args[11], args[2]))
+
+# === Función principal de graficado con paralelización por frame ===
+def programar_variable(pool, variable, tiempos, X, Y, lat, lon, logo, etiqueta_hora, cmap, niveles,
+                       nombre_variable, nombre_archivo_base, icca=None, niveles_icca=None,
+                       categorias=None, usar_icca=False, shapefiles=[], shrink_colorbar=0.4,
+                       usar_plantilla=None, indice_inicial=0, usar_cache=True, usar_raster=False,
+                       programa=None):
+
+    args, huella = preparar_frames(variable, tiempos, X, Y, lat, lon, logo, etiqueta_hora, cmap, niveles,
+                                   nombre_variable, nombre_archivo_base, icca, niveles_icca, categorias,
+                                   usar_icca, shapefiles, shrink_colorbar, usar_plantilla, indice_inicial,
+                                   usar_raster)
+
+    # === Caché de frames: solo se redibujan los frames cuya clave cambió ===
+    # La hora de creación no forma parte de la clave: un frame reutilizado conserva la suya.
+    # El registro (registro_cams) completa el índice con los frames que terminaron en una
+    # corrida interrumpida antes de guardarlo.
+    directorio, producto = os.path.split(nombre_archivo_base)
+    indice = {}
+    if usar_cache:
+        indice = cache_frames.leer_indice(nombre_archivo_base)
+        indice.update(registro_cams.claves_hechas(directorio, producto))
+    claves = {a[0] + 1: clave_frame(huella, a) for a in args}
+
+    # Los plazos fuera del programa no se dibujan aquí. Los que dibujó el servicio bajo
+    # demanda se conservan mientras su clave siga vigente; los de un ciclo anterior se borran.
+    fuera = {n for n in claves if not en_programa(n - 1, programa)}
+    if usar_cache:
+        vencidos = [n for n in sorted(fuera)
+                    if os.path.exists(ruta_frame(nombre_archivo_base, n)) and indice.get(n) != claves[n]]
+        for n in vencidos:
+            os.remove(ruta_frame(nombre_archivo_base, n))
+            indice.pop(n, None)
+        if vencidos:
+            cache_frames.guardar_indice(nombre_archivo_base, indice)
+    args = [a for a in args if a[0] + 1 not in fuera]
+    claves = {n: c for n, c in claves.items() if n not in fuera}
+    pendientes = [
+        a for a in args
+        if indice.get(a[0] + 1) != claves[a[0] + 1] or not os.path.exists(ruta_frame(nombre_archivo_base, a[0] + 1))
+    ]
+    if len(pendientes) < len(args):
+        print(f"♻️ {producto}: {len(args) - len(pendientes)} frames sin cambios reutilizados")
+    registro_cams.preparar(directorio, producto, claves, {a[0] + 1: str(a[2]) for a in args},
+                           {a[0] + 1 for a in pendientes})
+
+    # Los frames se encolan en el pool sin esperar; `esperar` recoge los resultados conforme
+    # terminan, registra cada frame en el registro, la caché y las métricas y devuelve los
+    # números de frame dibujados y los errores {frame: mensaje}. Un frame que falla no
+    # descarta los demás.
+    t_encolado = time.perf_counter()
+    resultado = pool.imap_unordered(_graficar_frame_seguro, pendientes) if pendientes else iter(())
+
+    def esperar():
+        renderizados, errores, cpu_segundos = [], {}, 0.0
+        try:
+            for n, medicion, error in resultado:
+                if error:
+                    print(f"❌ {producto} frame {n}: {error}")
+                    errores[n] = error
+                    registro_cams.marcar_grafico(directorio, producto, n, error)
+                    continue
+                metricas_cams.registrar_frame(medicion, producto=producto)
+                cpu_segundos += medicion["cpu_segundos"]
+                registro_cams.marcar_grafico(directorio, producto, n)
+                renderizados.append(n)
+        finally:
+            if usar_cache and renderizados:
+                # Se vuelve a leer el índice para no perder los frames que el servicio bajo
+                # demanda haya agregado mientras tanto
+                guardado = cache_frames.leer_indice(nombre_archivo_base)
+                guardado.update({n: claves[n] for n in renderizados})
+                cache_frames.guardar_indice(nombre_archivo_base, guardado)
+        # Pared desde que se encoló hasta que terminó el último frame (incluye la espera en
+        # cola); CPU sumada de los workers
+        metricas_cams.registrar_etapa("graficado", time.perf_counter() - t_encolado,
+                                      cpu_segundos=cpu_segundos, producto=producto)
+        return sorted(renderizados), errores
+
+    return esperar
+
+def graficar_variable(*args, pool=None, **kwargs):
+    if pool is not None:
+        return programar_variable(pool, *args, **kwargs)()
+    with Pool(processes=NUM_WORKERS) as pool:
+        return programar_variable(pool, *args, **kwargs)()
+
+# Elimina los frames de un producto que ya no corresponden a ningún plazo del ciclo actual
+def podar_frames(nombre_archivo_base, frames_validos):
+    directorio, nombre_base = os.path.split(nombre_archivo_base)
+    patron = _patron_frames(nombre_base)
+    for f in os.listdir(directorio):
+        coincidencia = patron.fullmatch(f)
+        if coincidencia and int(coincidencia.group(1)) not in frames_validos:
+            os.remove(os.path.join(directorio, f))
+    indice = cache_frames.leer_indice(nombre_archivo_base)
+    if any(n not in frames_validos for n in indice):
+        cache_frames.guardar_indice(nombre_archivo_base,
+                                    {n: c for n, c in indice.items() if n in frames_validos})
+    registro_cams.olvidar(directorio, nombre_base, frames_validos)
+
+# Campo y malla del producto de AOD; en modo reducido el campo se promedia por área a
+# bloques del tamaño de un píxel del mapa y se grafica como raster
+def _malla_aod(datos):
+    malla = dict(variable=datos["aod"], X=datos["X_aod"], Y=datos["Y_aod"],
+                 lat=datos["lat_aod"], lon=datos["lon_aod"])
+    if not AOD_REDUCIDO:
+        return malla
+    lat, lon = np.asarray(datos["lat_aod"]), np.asarray(datos["lon_aod"])
+    # El eje de longitudes ocupa a lo sumo RESOLUCION_MAPA píxeles y el de latitudes los
+    # proporcionales (la figura conserva la relación de aspecto de la extensión)
+    grados_px = (lon.max() - lon.min()) / RESOLUCION_MAPA
+    factor_lat = int(grados_px // abs(lat[1] - lat[0]))
+    factor_lon = int(grados_px // abs(lon[1] - lon[0]))
+    if factor_lat > 1 or factor_lon > 1:
+        campo, lat, lon = raster_cams.reducir_area(datos["aod"], lat, lon, factor_lat, factor_lon)
+        X, Y = np.meshgrid(lon, lat)
+        malla = dict(variable=datos_cams.compartir(os.path.join(datos["dir_campos"], "aod_reducido.npy"), campo),
+                     X=datos_cams.compartir(os.path.join(datos["dir_campos"], "X_aod_reducido.npy"), X),
+                     Y=datos_cams.compartir(os.path.join(datos["dir_campos"], "Y_aod_reducido.npy"), Y),
+                     lat=lat, lon=lon)
+    return dict(malla, usar_raster=True)
+
+# === Productos: parámetros de graficado y subcarpeta de destino ===
+def definir_productos(datos, recursos, etiqueta_hora):
+    ca = dict(X=datos["X"], Y=datos["Y"], lat=datos["lat"], lon=datos["lon"], logo=recursos["logo"],
+              etiqueta_hora=etiqueta_hora, shapefiles=recursos["shapefiles_ca"])
+    icca_ca = dict(icca=recursos["icca"], categorias=categorias, usar_icca=True, **ca)
+    productos = [
+        {"nombre": "cams_dust_total",
+         "parametros": dict(variable=datos["dust_total"], tiempos=datos["tiempo_plev_str"],
+                            cmap=colores_polvo(), niveles=niveles_dust,
+                            nombre_variable="Concentración de polvo a 1000 hPa (µg/m³)", **ca)},
+        {"nombre": "cams_aod_dust",
+         "parametros": dict(tiempos=datos["tiempo_sfc_aod_str"], logo=recursos["logo"],
+                            etiqueta_hora=etiqueta_hora, cmap="YlOrBr", niveles=niveles_aod,
+                            nombre_variable="AOD polvo 550nm", shapefiles=recursos["shapefiles_aod"],
+                            shrink_colorbar=0.25, **_malla_aod(datos))},
+        {"nombre": "cams_pm10_icca",
+         "parametros": dict(variable=datos["pm10"], tiempos=datos["tiempo_sfc_str"],
+                            cmap=paleta_icca, niveles=niveles_pm10_icca, nombre_variable="PM10 ICCA",
+                            niveles_icca=niveles_pm10_icca, usar_raster=RASTER_PM, **icca_ca)},
+        {"nombre": "cams_pm25_icca",
+         "parametros": dict(variable=datos["pm25"], tiempos=datos["tiempo_sfc_str"],
+                            cmap=paleta_icca, niveles=niveles_pm25_icca, nombre_variable="PM2.5 ICCA",
+                            niveles_icca=niveles_pm25_icca, usar_raster=RASTER_PM, **icca_ca)},
+        {"nombre": "cams_pm10",
+         "parametros": dict(variable=datos["pm10"], tiempos=datos["tiempo_sfc_str"],
+                            cmap="YlOrBr", niveles=niveles_pm10, nombre_variable="PM10 (µg/m³)",
+                            usar_raster=RASTER_PM, **ca)},
+        {"nombre": "cams_pm25",
+         "parametros": dict(variable=datos["pm25"], tiempos=datos["tiempo_sfc_str"],
+                            cmap="YlOrBr", niveles=niveles_pm25, nombre_variable="PM2.5 (µg/m³)",
+                            usar_raster=RASTER_PM, **ca)},
+    ]
+    return [dict(p, subcarpeta=SUBCARPETAS[p["nombre"]]) for p in productos
+            if PRODUCTOS is None or p["nombre"] in PRODUCTOS]
+
+# Manifiesto JSON del producto (frames y hora local de cada uno) para el visor web; los
+# plazos fuera del programa que el servicio aún no dibujó en este ciclo se listan como
+# frames bajo demanda (los ya dibujados siguen en disco tras programar_variable)
+def escribir_manifiesto(producto, indice_inicial=0):
+    import servicio_cams
+
+    tiempos = producto["parametros"]["tiempos"]
+    n_frames = min(len(producto["parametros"]["variable"]), len(tiempos))
+    return salida_cams.escribir_manifiesto(
+        os.path.join(IMG_DIR, f"{producto['nombre']}.json"), producto["nombre"], FORMATO_FRAMES,
+        {indice_inicial + i + 1: str(tiempos[i]) for i in range(n_frames)},
+        animacion=f"{producto['nombre']}.apng",
+        bajo_demanda={indice_inicial + i + 1 for i in range(n_frames) if not en_programa(indice_inicial + i)
+                      and not os.path.exists(ruta_frame(os.path.join(IMG_DIR, producto["nombre"]),
+                                                        indice_inicial + i + 1))},
+        servicio=servicio_cams.URL_PUBLICA)
+
+def graficar_producto(producto, indice_inicial=0, pool=None, usar_cache=True):
+    return graficar_variable(nombre_archivo_base=os.path.join(IMG_DIR, producto["nombre"]),
+                             indice_inicial=indice_inicial, pool=pool, usar_cache=usar_cache,
+                             **producto["parametros"])
+
+# === Planificador: graficado, GIF/ZIP y envío solapados entre productos ===
+# Los frames de todos los productos se encolan en un único pool de procesos. En cuanto
+# un producto termina, su GIF, ZIP y envío se hacen en un hilo mientras el pool sigue
+# graficando los productos siguientes. Devuelve la lista de productos cuyo envío falló.
+def procesar_productos(productos, pool=None, workers=None, indice_inicial=0, empaquetar=True, podar=True):
+    if pool is None:
+        with Pool(processes=workers or NUM_WORKERS) as pool:
+            return procesar_productos(productos, pool, indice_inicial=indice_inicial,
+                                      empaquetar=empaquetar, podar=podar)
+
+    esperas = [
+        (producto, programar_variable(pool, nombre_archivo_base=os.path.join(IMG_DIR, producto["nombre"]),
+                                      indice_inicial=indice_inicial, **producto["parametros"]))
+        for producto in productos
+    ]
 
-    with Pool(processes=4) as pool:
-        pool.map(graficar_frame, args)
+    fallidos = []
+    with ThreadPoolExecutor(max_workers=envio_cams.ENVIOS_SIMULTANEOS) as executor:
+        envios = {}
+        for producto, esperar in esperas:
+            try:
+                renderizados, errores = esperar()
+            except Exception as e:
+                print(f"❌ Error graficando {producto['nombre']}: {e}")
+                fallidos.append(producto["nombre"])
+                continue
+            if errores:
+                # Los frames que sí se dibujaron se envían igual; los fallidos quedan en el
+                # registro para la siguiente corrida
+                print(f"❌ {producto['nombre']}: {len(errores)} frames fallaron")
+                fallidos.append(producto["nombre"])
+            if podar:
+                # Solo los plazos que ya no existen en el ciclo; los frames bajo demanda
+                # vigentes se conservan (ver programar_variable)
+                n_frames = min(len(producto["parametros"]["variable"]), len(producto["parametros"]["tiempos"]))
+                podar_frames(os.path.join(IMG_DIR, producto["nombre"]), set(range(1, n_frames + 1)))
+            if salida_cams.tamano_fijo(FORMATO_FRAMES):
+                escribir_manifiesto(producto, indice_inicial)
+            # También los frames de corridas anteriores cuyo envío no terminó
+            por_enviar = set(renderizados) | registro_cams.pendientes_envio(IMG_DIR, producto["nombre"])
+            if por_enviar:
+                envios[producto["nombre"]] = executor.submit(sincronizar, producto["nombre"], producto["subcarpeta"],
+                                                             frames=por_enviar, empaquetar=empaquetar)
+            else:
+                print(f"✅ {producto['nombre']} sin cambios, no se vuelve a enviar")
+
+        for nombre, futuro in envios.items():
+            try:
+                ok = futuro.result()
+            except Exception as e:
+                print(f"❌ {nombre}: {e}")
+                ok = False
+            if not ok:
+                fallidos.append(nombre)
+    return fallidos
 
 # === Ejecuciones de graficado y sincronización ===
-graficar_variable(dust_total, tiempo_plev_str, X, Y, lat, lon, logo, etiqueta_hora,
-                  polvo_colores, niveles_dust, "Concentración de polvo a 1000 hPa (µg/m³)",
-                  os.path.join(IMG_DIR, "cams_dust_total"),
-                  shapefiles=[shp1, shp2, shp3])
-sincronizar("cams_dust_total", "dust_cams")
-
-graficar_variable(aod, tiempo_sfc_aod_str, X_aod, Y_aod, lat_aod, lon_aod, logo, etiqueta_hora,
-                  "YlOrBr", niveles_aod, "AOD polvo 550nm",
-                  os.path.join(IMG_DIR, "cams_aod_dust"),
-                  shapefiles=[shp1, shp2], shrink_colorbar=0.25)
-sincronizar("cams_aod_dust", "aod_cams")
-
-graficar_variable(pm10, tiempo_sfc_str, X, Y, lat, lon, logo, etiqueta_hora,
-                  paleta_icca, niveles_pm10_icca, "PM10 ICCA",
-                  os.path.join(IMG_DIR, "cams_pm10_icca"),
-                  icca=icca, niveles_icca=niveles_pm10_icca, categorias=categorias,
-                  usar_icca=True, shapefiles=[shp1, shp2, shp3])
-sincronizar("cams_pm10_icca", "pm10_cams_icca")
-
-graficar_variable(pm25, tiempo_sfc_str, X, Y, lat, lon, logo, etiqueta_hora,
-                  paleta_icca, niveles_pm25_icca, "PM2.5 ICCA",
-                  os.path.join(IMG_DIR, "cams_pm25_icca"),
-                  icca=icca, niveles_icca=niveles_pm25_icca, categorias=categorias,
-                  usar_icca=True, shapefiles=[shp1, shp2, shp3])
-sincronizar("cams_pm25_icca", "pm25_cams_icca")
-
-graficar_variable(pm10, tiempo_sfc_str, X, Y, lat, lon, logo, etiqueta_hora,
-                  "YlOrBr", niveles_pm10, "PM10 (µg/m³)",
-                  os.path.join(IMG_DIR, "cams_pm10"),
-                  shapefiles=[shp1, shp2, shp3])
-sincronizar("cams_pm10", "pm10_cams")
-
-graficar_variable(pm25, tiempo_sfc_str, X, Y, lat, lon, logo, etiqueta_hora,
-                  "YlOrBr", niveles_pm25, "PM2.5 (µg/m³)",
-                  os.path.join(IMG_DIR, "cams_pm25"),
-                  shapefiles=[shp1, shp2, shp3])
-sincronizar("cams_pm25", "pm25_cams")
\ No newline at end of file
+if __name__ == "__main__":
+    # Los PNG del ciclo anterior no se borran: la caché de frames decide qué redibujar
+    os.makedirs(IMG_DIR, exist_ok=True)
+    datos = cargar_datos()
+    fallidos = procesar_productos(definir_productos(datos, cargar_recursos(datos), crear_etiqueta_hora()))
+    metricas_cams.escribir(IMG_DIR)
+    if fallidos:
+        print(f"❌ Falló el procesamiento o envío de: {', '.join(fallidos)}")
+        sys.exit(1)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+# === Graficado raster por clases de color ===
+# Alternativa a contourf para campos en malla regular lat/lon: cada worker clasifica el
+# plazo que grafica (np.digitize) en índices de color uint8 y compone el frame sobre un
+# mapa base renderizado una sola vez por worker. El mapa base (costas,
+# fronteras, cuadrícula, logos, barra de color) se dibuja con fondo transparente y se
+# superpone al raster, así que las líneas quedan encima de los colores igual que con
+# contourf. Por frame solo se dibuja el título (blitting de Agg) y se indexa la tabla
+# de colores; no se construyen polígonos de contorno.
+
+# Factor máximo de refinamiento bilineal de la malla antes de clasificar: suaviza los
+# bordes entre clases. El factor de cada mapa es el número de píxeles por celda de la
+# malla (ver factor_refinamiento), así que una malla que ya tiene una celda por píxel o
+# más no se refina y el costo por frame depende del tamaño de la imagen.
+SUBMUESTREO = 8
+
+def factor_refinamiento(lat, lon, alto, ancho, maximo=SUBMUESTREO):
+    pixeles_celda = min(alto / max(len(lat) - 1, 1), ancho / max(len(lon) - 1, 1))
+    return int(min(max(pixeles_celda, 1), maximo))
+
+def _refinar(campos, factor, eje):
+    n = campos.shape[eje]
+    if factor <= 1 or n < 2:
+        return campos
+    posiciones = np.linspace(0, n - 1, (n - 1) * factor + 1)
+    i0 = np.minimum(posiciones.astype(int), n - 2)
+    peso = (posiciones - i0).astype(campos.dtype)
+    forma = [1] * campos.ndim
+    forma[eje] = -1
+    peso = peso.reshape(forma)
+    return np.take(campos, i0, axis=eje) * (1 - peso) + np.take(campos, i0 + 1, axis=eje) * peso
+
+# Reducción por área de todos los plazos (plazos, lat, lon) a bloques de factor_lat x
+# factor_lon celdas: promedio ponderado por cos(lat) que ignora los NaN. Los bloques del
+# borde pueden ser más pequeños. Devuelve (campos, lat, lon) de la malla reducida.
+def reducir_area(campos, lat, lon, factor_lat, factor_lon):
+    campos = np.asarray(campos, dtype=np.float32)
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    inicios_lat = np.arange(0, len(lat), max(factor_lat, 1))
+    inicios_lon = np.arange(0, len(lon), max(factor_lon, 1))
+
+    pesos = np.broadcast_to(np.cos(np.radians(lat))[:, None], campos.shape[1:]).astype(np.float64)
+    validos = ~np.isnan(campos)
+    pesos = np.where(validos, pesos, 0)
+
+    def sumar(arreglo):
+        return np.add.reduceat(np.add.reduceat(arreglo, inicios_lat, axis=-2), inicios_lon, axis=-1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        reducido = sumar(np.where(validos, campos, 0) * pesos) / sumar(pesos)
+    centros_lat = np.add.reduceat(lat, inicios_lat) / np.diff(np.append(inicios_lat, len(lat)))
+    centros_lon = np.add.reduceat(lon, inicios_lon) / np.diff(np.append(inicios_lon, len(lon)))
+    return reducido.astype(np.float32), centros_lat, centros_lon
+
+# Clasifica un campo (lat, lon), o varios plazos (plazos, lat, lon), en índices de color:
+# 0 por debajo del primer nivel, len(niveles) por encima del último y len(niveles) + 1
+# para NaN
+def clasificar(campos, niveles, factor=SUBMUESTREO):
+    campos = np.asarray(campos, dtype=np.float32)
+    campos = _refinar(_refinar(campos, factor, campos.ndim - 2), factor, campos.ndim - 1)
+    niveles = np.asarray(niveles, dtype=np.float32)
+    if len(niveles) + 2 > 256:
+        raise ValueError(f"Demasiados niveles para índices uint8: {len(niveles)}")
+    # right=True: niveles[k-1] < valor <= niveles[k], igual que las bandas de contourf
+    clases = np.digitize(campos, niveles, right=True).astype(np.uint8)
+    clases[np.isnan(campos)] = len(niveles) + 1
+    return clases
+
+# Tabla RGB (len(niveles) + 2, 3) con los mismos colores que usaría contourf con
+# extend="both"; la última entrada (NaN) es blanca como el fondo del mapa
+def tabla_colores(cmap, niveles, usar_icca=False):
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import Normalize, to_rgba_array
+
+    niveles = np.asarray(niveles, dtype=float)
+    if usar_icca:
+        colores = to_rgba_array(cmap)
+        bandas = colores[np.clip(np.arange(len(niveles) - 1), 0, len(colores) - 1)]
+        debajo, encima = colores[0], colores[-1]
+    else:
+        cmap = plt.get_cmap(cmap) if isinstance(cmap, str) else cmap
+        norma = Normalize(niveles[0], niveles[-1])
+        bandas = cmap(norma((niveles[:-1] + niveles[1:]) / 2))
+        debajo, encima = cmap.get_under(), cmap.get_over()
+    tabla = np.vstack([debajo, bandas, encima, (1, 1, 1, 1)])
+    return np.round(tabla[:, :3] * 255).astype(np.uint8)
+
+# Índices (filas, columnas) de la malla de clases para cada píxel del recuadro del mapa.
+# `lat`/`lon` son las coordenadas originales; la malla refinada las divide en `factor`.
+def indices_pixeles(lat, lon, alto, ancho, factor=SUBMUESTREO):
+    def eje(coords, n_pixeles, invertir):
+        coords = np.asarray(coords, dtype=float)
+        n = (len(coords) - 1) * factor + 1
+        refinadas = np.linspace(coords[0], coords[-1], n)
+        lo, hi = min(coords[0], coords[-1]), max(coords[0], coords[-1])
+        centros = lo + (np.arange(n_pixeles) + 0.5) / n_pixeles * (hi - lo)
+        if invertir:
+            centros = centros[::-1]
+        orden = np.argsort(refinadas)
+        indice = np.interp(centros, refinadas[orden], orden.astype(float))
+        return np.clip(np.round(indice).astype(np.intp), 0, n - 1)
+
+    # Las filas de la imagen van de norte a sur
+    return eje(lat, alto, invertir=True), eje(lon, ancho, invertir=False)
+
+class PlantillaRaster:
+    # `fig` y `ax` ya tienen el mapa base completo (sin campo) y `titulo` el texto del
+    # primer frame para que el recorte ajustado incluya el título. Con `recortar=False`
+    # se conserva el tamaño completo de la figura. Sin `factor` se usa el de
+    # factor_refinamiento para el tamaño del recuadro del mapa.
+    def __init__(self, fig, ax, titulo, lat, lon, tabla, factor=None, recortar=True):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        self.fig, self.ax, self.titulo, self.tabla = fig, ax, titulo, tabla
+        self.canvas = FigureCanvasAgg(fig)
+        fig.patch.set_alpha(0)
+        ax.patch.set_visible(False)
+
+        # Recorte equivalente a bbox_inches='tight' (pad de 0.1 pulgadas)
+        self.canvas.draw()
+        alto_fig = fig.bbox.height
+        if recortar:
+            caja = fig.get_tightbbox(self.canvas.get_renderer()).padded(0.1)
+            dpi = fig.dpi
+            self.recorte = (int(round(alto_fig - caja.y1 * dpi)), int(round(alto_fig - caja.y0 * dpi)),
+                            int(round(caja.x0 * dpi)), int(round(caja.x1 * dpi)))
+        else:
+            self.recorte = (0, int(alto_fig), 0, int(fig.bbox.width))
+
+        # Mapa base sin título; el título se dibuja encima en cada frame
+        titulo.set_visible(False)
+        self.canvas.draw()
+        self.fondo = self.canvas.copy_from_bbox(fig.bbox)
+        titulo.set_visible(True)
+
+        caja_ax = ax.bbox
+        self.fila0, self.fila1 = int(round(alto_fig - caja_ax.y1)), int(round(alto_fig - caja_ax.y0))
+        self.col0, self.col1 = int(round(caja_ax.x0)), int(round(caja_ax.x1))
+        alto, ancho = self.fila1 - self.fila0, self.col1 - self.col0
+        self.factor = factor or factor_refinamiento(lat, lon, alto, ancho)
+        self.filas, self.columnas = indices_pixeles(lat, lon, alto, ancho, self.factor)
+
+    def componer(self, clases, texto_titulo):
+        self.canvas.restore_region(self.fondo)
+        self.titulo.set_text(texto_titulo)
+        self.ax.draw_artist(self.titulo)
+        capa = np.asarray(self.canvas.buffer_rgba())
+
+        f0, f1, c0, c1 = self.recorte
+        capa = capa[max(f0, 0):f1, max(c0, 0):c1]
+        alfa = capa[..., 3:4].astype(np.float32) / 255
+
+        # Debajo del mapa base: blanco, y los colores del campo en el recuadro del mapa
+        debajo = np.full(capa.shape[:2] + (3,), 255, dtype=np.uint8)
+        fila0, col0 = self.fila0 - max(f0, 0), self.col0 - max(c0, 0)
+        colores = self.tabla[np.asarray(clases)[np.ix_(self.filas, self.columnas)]]
+        debajo[fila0:fila0 + colores.shape[0], col0:col0 + colores.shape[1]] = colores
+
+        return (capa[..., :3] * alfa + debajo * (1 - alfa) + 0.5).astype(np.uint8)
+
+    def guardar(self, clases, texto_titulo, ruta, formato="png"):
+        import salida_cams
+
+        salida_cams.guardar_imagen(self.componer(clases, texto_titulo), ruta, formato)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import sqlite3
+
+# === Registro persistente del estado de cada frame ===
+# Un SQLite en el directorio de imágenes guarda, por producto y número de frame, la clave
+# de caché (identifica los datos del ciclo), si el frame se graficó y si se envió, con el
+# último error. Cada cambio se confirma de inmediato, así que tras un reinicio o una
+# excepción en el pool la siguiente corrida solo redibuja los frames que faltan o
+# fallaron y solo reenvía los que no llegaron al servidor. También guarda de qué NetCDF
+# partió la última corrida (los del ciclo completo o los bloques del flujo incremental),
+# para que reanudar y el servicio bajo demanda lean los mismos.
+NOMBRE = "registro_cams.sqlite"
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    producto TEXT NOT NULL,
+    frame INTEGER NOT NULL,
+    clave TEXT NOT NULL,
+    hora TEXT,
+    grafico TEXT NOT NULL,  -- pendiente | hecho | error
+    envio TEXT NOT NULL,    -- pendiente | enviado | error
+    error TEXT,
+    actualizado REAL NOT NULL,
+    PRIMARY KEY (producto, frame)
+);
+CREATE TABLE IF NOT EXISTS entradas (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    bloques TEXT NOT NULL,  -- JSON [[plazo_inicial, plazo_final), ...]; [] = ciclo completo
+    actualizado REAL NOT NULL,
+    fecha TEXT              -- fecha de inicialización (YYYY-MM-DD) de los bloques
+);
+"""
+
+# Una conexión por llamada: los envíos actualizan el registro desde varios hilos
+def _conectar(directorio):
+    con = sqlite3.connect(os.path.join(directorio, NOMBRE), timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript(_ESQUEMA)
+    # Registros creados antes de que `entradas` guardara la fecha del ciclo
+    if "fecha" not in {fila[1] for fila in con.execute("PRAGMA table_info(entradas)")}:
+        con.execute("ALTER TABLE entradas ADD COLUMN fecha TEXT")
+    return con
+
+def _ejecutar(directorio, sql, filas):
+    con = _conectar(directorio)
+    try:
+        with con:
+            con.executemany(sql, filas)
+    finally:
+        con.close()
+
+def _consultar(directorio, sql, parametros=()):
+    con = _conectar(directorio)
+    try:
+        return con.execute(sql, parametros).fetchall()
+    finally:
+        con.close()
+
+# Frames {n: clave} ya graficados con esa clave (sirven como caché aunque el índice
+# JSON no llegara a guardarse)
+def claves_hechas(directorio, producto):
+    return {n: clave for n, clave in _consultar(
+        directorio, "SELECT frame, clave FROM frames WHERE producto = ? AND grafico = 'hecho'", (producto,))}
+
+# Registra los frames del ciclo: los de `pendientes` quedan por graficar y enviar; los
+# reutilizados de la caché que no estaban en el registro se dan por graficados y enviados
+def preparar(directorio, producto, claves, horas, pendientes):
+    ahora = time.time()
+    _ejecutar(directorio, """
+        INSERT INTO frames VALUES (?, ?, ?, ?, 'pendiente', 'pendiente', NULL, ?)
+        ON CONFLICT (producto, frame) DO UPDATE SET clave = excluded.clave, hora = excluded.hora,
+            grafico = 'pendiente', envio = 'pendiente', error = NULL, actualizado = excluded.actualizado
+    """, [(producto, n, claves[n], horas[n], ahora) for n in pendientes])
+    _ejecutar(directorio, """
+        INSERT INTO frames VALUES (?, ?, ?, ?, 'hecho', 'enviado', NULL, ?)
+        ON CONFLICT (producto, frame) DO NOTHING
+    """, [(producto, n, claves[n], horas[n], ahora) for n in claves if n not in pendientes])
+
+def marcar_grafico(directorio, producto, n, error=None):
+    _ejecutar(directorio, "UPDATE frames SET grafico = ?, error = ?, actualizado = ? WHERE producto = ? AND frame = ?",
+              [("error" if error else "hecho", error, time.time(), producto, n)])
+
+def marcar_envio(directorio, producto, frames, ok):
+    _ejecutar(directorio, """
+        UPDATE frames SET envio = ?, error = CASE WHEN ? THEN error ELSE 'envío fallido' END, actualizado = ?
+        WHERE producto = ? AND frame = ? AND grafico = 'hecho'
+    """, [("enviado" if ok else "error", ok, time.time(), producto, n) for n in frames])
+
+# Frames graficados que aún no llegaron al servidor
+def pendientes_envio(directorio, producto):
+    return {n for (n,) in _consultar(
+        directorio, "SELECT frame FROM frames WHERE producto = ? AND grafico = 'hecho' AND envio != 'enviado'",
+        (producto,))}
+
+# Quita del registro los frames que ya no corresponden al ciclo (ver podar_frames)
+def olvidar(directorio, producto, frames_validos):
+    filas = _consultar(directorio, "SELECT frame FROM frames WHERE producto = ?", (producto,))
+    _ejecutar(directorio, "DELETE FROM frames WHERE producto = ? AND frame = ?",
+              [(producto, n) for (n,) in filas if n not in frames_validos])
+
+# {producto: {"grafico": {estado: n}, "envio": {estado: n}}}
+def resumen(directorio):
+    if not os.path.exists(os.path.join(directorio, NOMBRE)):
+        return {}
+    estados = {}
+    for producto, grafico, envio, n in _consultar(
+            directorio, "SELECT producto, grafico, envio, COUNT(*) FROM frames GROUP BY producto, grafico, envio"):
+        e = estados.setdefault(producto, {"grafico": {}, "envio": {}})
+        e["grafico"][grafico] = e["grafico"].get(grafico, 0) + n
+        e["envio"][envio] = e["envio"].get(envio, 0) + n
+    return estados
+
+# Frames con error de graficado o envío: [(producto, frame, error)]
+def errores(directorio):
+    if not os.path.exists(os.path.join(directorio, NOMBRE)):
+        return []
+    return _consultar(directorio, """
+        SELECT producto, frame, error FROM frames WHERE grafico = 'error' OR envio = 'error' ORDER BY producto, frame
+    """)
+
+# Registra las entradas de la corrida: `bloques` son los rangos de plazos del flujo
+# incremental (vacío = NetCDF del ciclo completo) y `fecha` el ciclo que se descarga
+def registrar_entradas(directorio, bloques=(), fecha=None):
+    _ejecutar(directorio, "INSERT OR REPLACE INTO entradas (id, bloques, fecha, actualizado) VALUES (1, ?, ?, ?)",
+              [(json.dumps([[p.start, p.stop] for p in bloques]), fecha, time.time())])
+
+# Bloques [range] de la última corrida; [] si usó el ciclo completo o no hay registro
+def entradas(directorio):
+    if not os.path.exists(os.path.join(directorio, NOMBRE)):
+        return []
+    filas = _consultar(directorio, "SELECT bloques FROM entradas WHERE id = 1")
+    return [range(inicio, fin) for inicio, fin in json.loads(filas[0][0])] if filas else []
+
+# Fecha de inicialización de los bloques de la última corrida; None si no se registró
+def fecha_entradas(directorio):
+    if not os.path.exists(os.path.join(directorio, NOMBRE)):
+        return None
+    filas = _consultar(directorio, "SELECT fecha FROM entradas WHERE id = 1")
+    return filas[0][0] if filas else None
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from multiprocessing import Pool
+
+import matplotlib
+matplotlib.use("Agg")
+
+import numpy as np
+from PIL import Image
+
+import fixtures_cams
+import procesamiento_cams as pc
+
+# === Regresión visual de los mapas contra imágenes de referencia ===
+# Grafica un conjunto fijo de frames a partir de los datos sintéticos de fixtures_cams
+# (sin red, con Agg) en cada modo de graficado y los compara con las imágenes de
+# referencia de DIR_REFERENCIAS con una tolerancia perceptual: diferencia de color
+# CIE76 (ΔE en Lab) por píxel, admitiendo un desplazamiento de hasta DESPLAZAMIENTO_MAX
+# píxeles por el recorte ajustado. El modo sin plantilla se compara contra las mismas
+# referencias que el modo con plantilla, así que también verifica que la reutilización
+# de plantillas no cambie el mapa. Además, en los productos ICCA se comprueba píxel a
+# píxel que cada celda de la malla cuyos cuatro vértices caen en la misma categoría se
+# pinte con el color de esa categoría.
+#   python regresion_cams.py               compara y sale con 1 si algo no coincide
+#   python regresion_cams.py --actualizar  regenera las referencias (revisarlas antes de commitear)
+DIR_REFERENCIAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "referencias_cams")
+HORAS = 3
+ETIQUETA_HORA = "Hora de creación: 01/01/2026 00:00:00 (hora local)"
+
+# Un píxel cuenta como distinto si su ΔE supera TOLERANCIA_DELTA_E; la imagen pasa si
+# los distintos no superan FRACCION_MAXIMA y el ΔE medio no supera DELTA_MEDIO_MAXIMO
+TOLERANCIA_DELTA_E = 10.0
+FRACCION_MAXIMA = 0.005
+DELTA_MEDIO_MAXIMO = 1.0
+DESPLAZAMIENTO_MAX = 2
+
+# Colores ICCA: un píxel se considera pintado con la paleta si está a menos de
+# DELTA_PALETA de algún color; de esos, a lo sumo FRACCION_ICCA_MAXIMA pueden tener
+# una categoría distinta de la esperada
+DELTA_PALETA = 8.0
+FRACCION_ICCA_MAXIMA = 0.002
+
+# Modo -> (constantes de procesamiento_cams, {producto: frames}, modo cuyas referencias usa)
+MODOS = {
+    "contorno": (dict(USAR_PLANTILLA=True, RASTER_PM=False, AOD_REDUCIDO=False), {
+        "cams_pm10_icca": [1, 3], "cams_pm25_icca": [2], "cams_pm10": [1], "cams_pm25": [3],
+        "cams_dust_total": [1], "cams_aod_dust": [2],
+    }, "contorno"),
+    "sin_plantilla": (dict(USAR_PLANTILLA=False, RASTER_PM=False, AOD_REDUCIDO=False), {
+        "cams_pm10_icca": [1, 3], "cams_aod_dust": [2],
+    }, "contorno"),
+    "raster": (dict(USAR_PLANTILLA=True, RASTER_PM=True, AOD_REDUCIDO=False), {
+        "cams_pm10_icca": [1, 3], "cams_pm25": [2],
+    }, "raster"),
+    "aod_reducido": (dict(USAR_PLANTILLA=True, RASTER_PM=False, AOD_REDUCIDO=True), {
+        "cams_aod_dust": [2],
+    }, "aod_reducido"),
+}
+
+# Productos ICCA y modos en los que se verifican las categorías píxel a píxel
+VERIFICACION_ICCA = [("contorno", "cams_pm10_icca", 2), ("contorno", "cams_pm25_icca", 1),
+                     ("raster", "cams_pm10_icca", 2), ("raster", "cams_pm25_icca", 3)]
+
+def ruta_referencia(modo, producto, n):
+    return os.path.join(DIR_REFERENCIAS, f"{modo}__{producto}_{n:03}.png")
+
+# === Comparación perceptual ===
+def lab(rgb):
+    # sRGB (D65) -> CIE Lab
+    c = np.asarray(rgb, dtype=np.float64) / 255
+    c = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    xyz = c @ np.array([[0.4124, 0.2126, 0.0193], [0.3576, 0.7152, 0.1192], [0.1805, 0.0722, 0.9505]])
+    xyz /= np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([116 * f[..., 1] - 16, 500 * (f[..., 0] - f[..., 1]), 200 * (f[..., 1] - f[..., 2])], axis=-1)
+
+def _leer_rgb(ruta):
+    with Image.open(ruta) as imagen:
+        return np.asarray(imagen.convert("RGB"))
+
+# ΔE por píxel sobre la zona común de las dos imágenes con `actual` desplazada (dy, dx)
+def _delta(lab_actual, lab_referencia, dy, dx):
+    alto = min(lab_actual.shape[0] - max(dy, 0), lab_referencia.shape[0] + min(dy, 0))
+    ancho = min(lab_actual.shape[1] - max(dx, 0), lab_referencia.shape[1] + min(dx, 0))
+    a = lab_actual[max(dy, 0):max(dy, 0) + alto, max(dx, 0):max(dx, 0) + ancho]
+    r = lab_referencia[max(-dy, 0):max(-dy, 0) + alto, max(-dx, 0):max(-dx, 0) + ancho]
+    return np.sqrt(((a - r) ** 2).sum(axis=-1))
+
+def comparar(ruta_actual, ruta_referencia, ruta_diferencia=None):
+    actual, referencia = _leer_rgb(ruta_actual), _leer_rgb(ruta_referencia)
+    diferencia_tamano = np.abs(np.subtract(actual.shape[:2], referencia.shape[:2]))
+    if diferencia_tamano.max() > DESPLAZAMIENTO_MAX:
+        return {"ok": False, "motivo": f"tamaño {actual.shape[1]}x{actual.shape[0]} "
+                                       f"vs {referencia.shape[1]}x{referencia.shape[0]}"}
+
+    lab_actual, lab_referencia = lab(actual), lab(referencia)
+    delta = _delta(lab_actual, lab_referencia, 0, 0)
+    if actual.shape != referencia.shape or (delta > TOLERANCIA_DELTA_E).mean() > FRACCION_MAXIMA:
+        # El recorte ajustado puede mover la imagen uno o dos píxeles
+        rango = range(-DESPLAZAMIENTO_MAX, DESPLAZAMIENTO_MAX + 1)
+        delta = min((_delta(lab_actual, lab_referencia, dy, dx) for dy in rango for dx in rango),
+                    key=lambda d: (d > TOLERANCIA_DELTA_E).mean())
+
+    fraccion, medio = float((delta > TOLERANCIA_DELTA_E).mean()), float(delta.mean())
+    ok = fraccion <= FRACCION_MAXIMA and medio <= DELTA_MEDIO_MAXIMO
+    if not ok and ruta_diferencia:
+        mapa = np.clip(delta * 8, 0, 255).astype(np.uint8)
+        Image.fromarray(np.stack([mapa, np.zeros_like(mapa), np.zeros_like(mapa)], axis=-1)).save(ruta_diferencia)
+    return {"ok": ok, "fraccion_distinta": round(fraccion, 5), "delta_medio": round(medio, 3)}
+
+# === Categorías ICCA píxel a píxel ===
+# Grafica el frame en este proceso (con la plantilla, para conocer la figura y los ejes)
+# a tamaño fijo y compara cada píxel del mapa con la categoría esperada según el campo
+def verificar_icca(producto, n, directorio):
+    import salida_cams
+
+    formato_anterior, pc.FORMATO_FRAMES = pc.FORMATO_FRAMES, "webp"
+    try:
+        base = os.path.join(directorio, f"icca_{producto['nombre']}")
+        args, _ = pc.preparar_frames(nombre_archivo_base=base, **producto["parametros"])
+        pc._graficar_frame(args[n - 1])
+        ruta = f"{base}_{n:03}.{salida_cams.extension('webp')}"
+    finally:
+        pc.FORMATO_FRAMES = formato_anterior
+    parametros = producto["parametros"]
+    if parametros.get("usar_raster"):
+        ax = pc._plantillas[(base, "raster")][2].ax
+    else:
+        ax = pc._plantillas[(base, "contorno")][2]["ax"]
+    imagen = _leer_rgb(ruta)
+
+    # Centros de los píxeles del recuadro del mapa en lon/lat
+    alto_fig = imagen.shape[0]
+    x0, y0, x1, y1 = ax.bbox.extents
+    filas = np.arange(int(np.ceil(alto_fig - y1)), int(np.floor(alto_fig - y0)))
+    columnas = np.arange(int(np.ceil(x0)), int(np.floor(x1)))
+    lon_min, lon_max, lat_min, lat_max = ax.get_extent()
+    lon = lon_min + (columnas + 0.5 - x0) / (x1 - x0) * (lon_max - lon_min)
+    lat = lat_max - (filas + 0.5 - (alto_fig - y1)) / (y1 - y0) * (lat_max - lat_min)
+    LON, LAT = np.meshgrid(lon, lat)
+
+    # Celda de la malla de cada píxel y si sus cuatro vértices comparten categoría
+    niveles = parametros["niveles_icca"]
+    lat_malla, lon_malla = np.asarray(parametros["lat"], dtype=float), np.asarray(parametros["lon"], dtype=float)
+    campo = np.asarray(parametros["variable"][n - 1], dtype=float)
+    if lat_malla[0] > lat_malla[-1]:
+        lat_malla, campo = lat_malla[::-1], campo[::-1]
+    categoria = np.clip(np.digitize(campo, niveles[1:-1], right=True), 0, len(pc.paleta_icca) - 1)
+    uniforme = ((categoria[:-1, :-1] == categoria[1:, :-1]) & (categoria[:-1, :-1] == categoria[:-1, 1:])
+                & (categoria[:-1, :-1] == categoria[1:, 1:]))
+    i = np.clip(np.searchsorted(lat_malla, LAT) - 1, 0, len(lat_malla) - 2)
+    j = np.clip(np.searchsorted(lon_malla, LON) - 1, 0, len(lon_malla) - 2)
+    verificar = uniforme[i, j]
+    # Fuera de los logos (la imagen del ICCA tiene colores parecidos a la paleta)
+    for logo in ax.images:
+        l0, l1, b0, b1 = logo.get_extent()
+        verificar &= ~((LON >= min(l0, l1)) & (LON <= max(l0, l1)) & (LAT >= min(b0, b1)) & (LAT <= max(b0, b1)))
+
+    from matplotlib.colors import to_rgb
+    paleta = lab(np.array([to_rgb(c) for c in pc.paleta_icca]) * 255)
+    pixeles = lab(imagen[np.ix_(filas, columnas)])
+    distancias = np.sqrt(((pixeles[..., None, :] - paleta) ** 2).sum(axis=-1))
+    pintado = verificar & (distancias.min(axis=-1) < DELTA_PALETA)
+    incorrecto = pintado & (distancias.argmin(axis=-1) != categoria[i, j])
+    n_pintados = int(pintado.sum())
+    fraccion = incorrecto.sum() / n_pintados if n_pintados else 1.0
+    ok = n_pintados > 0.5 * verificar.sum() and fraccion <= FRACCION_ICCA_MAXIMA
+    return {"ok": bool(ok), "pixeles_verificados": int(verificar.sum()), "pixeles_pintados": n_pintados,
+            "fraccion_incorrecta": round(float(fraccion), 5)}
+
+# === Ejecución ===
+def _configurar(constantes):
+    for nombre, valor in constantes.items():
+        setattr(pc, nombre, valor)
+
+def ejecutar(actualizar=False, salida=None, workers=None):
+    temporal = salida is None
+    base_dir = salida or tempfile.mkdtemp(prefix="regresion_cams_")
+    rutas = fixtures_cams.preparar_entorno(base_dir, HORAS)
+    pc.FORMATO_FRAMES, pc.PROGRAMA_FRAMES = "png", None
+    datos = pc.cargar_datos(rutas["datos"])
+    resultados, fallos = [], 0
+    t0 = time.perf_counter()
+    try:
+        with Pool(processes=workers or pc.NUM_WORKERS) as pool:
+            # Los frames de todos los modos se encolan juntos en el pool y se esperan al final
+            esperas, casos_por_modo = [], []
+            for modo, (constantes, casos, modo_referencia) in MODOS.items():
+                _configurar(constantes)
+                directorio = os.path.join(base_dir, modo)
+                os.makedirs(directorio, exist_ok=True)
+                productos = {p["nombre"]: p for p in pc.definir_productos(datos, pc.cargar_recursos(datos),
+                                                                          ETIQUETA_HORA)}
+                for nombre, frames in casos.items():
+                    base = os.path.join(directorio, nombre)
+                    esperas.append(pc.programar_variable(pool, nombre_archivo_base=base, usar_cache=False,
+                                                         **productos[nombre]["parametros"]))
+                    casos_por_modo += [(modo, modo_referencia, nombre, base, n) for n in frames]
+            for esperar in esperas:
+                _, errores = esperar()
+                if errores:
+                    raise RuntimeError(f"Falló el graficado: {errores}")
+
+            for modo, modo_referencia, nombre, base, n in casos_por_modo:
+                ruta = pc.ruta_frame(base, n)
+                referencia = ruta_referencia(modo_referencia, nombre, n)
+                if actualizar and modo == modo_referencia:
+                    os.makedirs(DIR_REFERENCIAS, exist_ok=True)
+                    shutil.copyfile(ruta, referencia)
+                    continue
+                if not os.path.exists(referencia):
+                    resultado = {"ok": False, "motivo": "sin imagen de referencia"}
+                else:
+                    resultado = comparar(ruta, referencia, f"{ruta[:-4]}_diferencia.png")
+                resultados.append((f"{modo}/{nombre}_{n:03}", resultado))
+
+            for modo, nombre, n in VERIFICACION_ICCA:
+                _configurar(MODOS[modo][0])
+                directorio = os.path.join(base_dir, f"icca_{modo}")
+                os.makedirs(directorio, exist_ok=True)
+                producto = next(p for p in pc.definir_productos(datos, pc.cargar_recursos(datos), ETIQUETA_HORA)
+                                if p["nombre"] == nombre)
+                resultados.append((f"icca/{modo}/{nombre}_{n:03}", verificar_icca(producto, n, directorio)))
+    finally:
+        if temporal:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    for caso, resultado in resultados:
+        fallos += not resultado["ok"]
+        detalle = ", ".join(f"{k}={v}" for k, v in resultado.items() if k != "ok")
+        print(f"{'✅' if resultado['ok'] else '❌'} {caso}: {detalle}")
+    if actualizar:
+        print(f"🖼️ Referencias actualizadas en {DIR_REFERENCIAS}")
+    print(f"⏱️ {len(resultados)} verificaciones en {time.perf_counter() - t0:.1f} s, {fallos} con diferencias")
+    return fallos == 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regresión visual de los mapas CAMS contra imágenes de referencia")
+    parser.add_argument("--actualizar", action="store_true", help="regenerar las imágenes de referencia")
+    parser.add_argument("--salida", default=None,
+                        help="conservar aquí los frames graficados y los mapas de diferencias")
+    parser.add_argument("--workers", type=int, default=None, help="procesos de graficado (uno por CPU)")
+    args = parser.parse_args()
+    sys.exit(0 if ejecutar(args.actualizar, args.salida, args.workers) else 1)
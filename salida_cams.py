@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import datetime
+import numpy as np
+from PIL import Image
+
+# === Formatos de salida de los frames ===
+# "png": PNG recortado con bbox_inches='tight' (formato histórico, acompañado de GIF y ZIP)
+# "webp": WebP sin pérdida a tamaño fijo de la figura
+# "png8": PNG con paleta de 256 colores a tamaño fijo de la figura
+# Los formatos de tamaño fijo no recalculan el recorte ajustado en cada frame: la figura
+# se rasteriza con Agg y se codifica directamente con Pillow. Para el visor web se
+# escribe además una animación APNG y un manifiesto JSON con los frames y sus horas.
+FORMATOS = {"png": "png", "webp": "webp", "png8": "png"}
+
+def extension(formato):
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de frames desconocido: {formato}")
+    return FORMATOS[formato]
+
+def tamano_fijo(formato):
+    return formato != "png"
+
+# Píxeles RGB de la figura completa renderizada con Agg
+def rasterizar(fig):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    canvas = fig.canvas if isinstance(fig.canvas, FigureCanvasAgg) else FigureCanvasAgg(fig)
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba())[..., :3]
+
+def guardar_imagen(rgb, ruta, formato):
+    imagen = Image.fromarray(np.ascontiguousarray(rgb))
+    if formato == "webp":
+        imagen.save(ruta, format="WEBP", lossless=True)
+    elif formato == "png8":
+        imagen.quantize(colors=256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE).save(ruta)
+    else:
+        imagen.save(ruta, format="PNG")
+
+# Guarda una figura de matplotlib en el formato indicado
+def guardar_figura(fig, ruta, formato):
+    if tamano_fijo(formato):
+        guardar_imagen(rasterizar(fig), ruta, formato)
+    else:
+        fig.savefig(ruta, bbox_inches='tight')
+
+# === Manifiesto para el visor web ===
+# {producto, formato, animacion, generado, frames: [{frame, archivo, hora}]}. Los frames
+# se combinan con los del manifiesto anterior (el flujo incremental lo escribe por bloques)
+# y solo se listan los que existen en disco, salvo los de `bajo_demanda`, que se marcan
+# con "bajo_demanda": true para que el visor los pida a la URL del servicio de graficado
+# (servicio_cams), que va en "servicio".
+def escribir_manifiesto(ruta, producto, formato, horas, animacion=None, bajo_demanda=(), servicio=None):
+    directorio = os.path.dirname(ruta)
+    frames = {}
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            anterior = json.load(f)
+        if anterior.get("formato") == formato:
+            frames = {e["frame"]: e for e in anterior.get("frames", [])}
+    except (OSError, ValueError):
+        pass
+
+    for n, hora in horas.items():
+        frames[n] = {"frame": n, "archivo": f"{producto}_{n:03}.{extension(formato)}", "hora": hora}
+        if n in bajo_demanda:
+            frames[n]["bajo_demanda"] = True
+        else:
+            frames[n].pop("bajo_demanda", None)
+    frames = {n: e for n, e in frames.items()
+              if e.get("bajo_demanda") or os.path.exists(os.path.join(directorio, e["archivo"]))}
+
+    manifiesto = {
+        "producto": producto,
+        "formato": formato,
+        "animacion": animacion,
+        "servicio": servicio if bajo_demanda else None,
+        "generado": datetime.datetime.now().isoformat(timespec="seconds"),
+        "frames": [frames[n] for n in sorted(frames)],
+    }
+    ruta_tmp = f"{ruta}.{os.getpid()}.tmp"
+    with open(ruta_tmp, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, ensure_ascii=False, indent=1)
+    os.replace(ruta_tmp, ruta)
+    return manifiesto
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+import os
+import hashlib
+import numpy as np
+
+# === Series de tiempo por departamento y por estación ===
+# Los pesos de cada celda de la malla dentro de cada departamento (área de la
+# intersección, corregida por cos(lat)) y la celda más cercana a cada estación se
+# calculan una sola vez y se guardan en la caché de geometrías. Con eso todos los plazos
+# de un campo se reducen en una sola multiplicación de matrices (plazos x celdas) @
+# (celdas x regiones). Los campos son los mismos .npy que usan los mapas (datos_cams).
+EXPORTAR = True
+COLUMNA_NOMBRE = "NOM_DPTO"
+VERSION_PESOS = 1
+
+# Estaciones: [{"nombre": ..., "lat": ..., "lon": ...}] (se configuran en cams.py)
+ESTACIONES = []
+
+# Formatos de salida: "csv", "json" y "parquet" (este último requiere pyarrow)
+FORMATOS = ["csv", "json"]
+
+# (campo en `datos`, columna de salida, malla): "ca" = Centroamérica, "aod" = área extendida
+VARIABLES = [
+    ("pm10", "pm10", "ca"),
+    ("pm25", "pm25", "ca"),
+    ("dust_total", "polvo", "ca"),
+    ("aod", "aod", "aod"),
+]
+
+def _bordes(coords):
+    # Bordes de las celdas de una malla regular a partir de sus centros
+    coords = np.asarray(coords, dtype=float)
+    medios = (coords[:-1] + coords[1:]) / 2
+    return np.concatenate([[coords[0] - (medios[0] - coords[0])], medios,
+                           [coords[-1] + (coords[-1] - medios[-1])]])
+
+def _calcular_pesos(ruta_shp, lat, lon):
+    import geopandas as gpd
+    from shapely.geometry import box
+    from shapely.strtree import STRtree
+
+    gdf = gpd.read_file(ruta_shp)
+    if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(4326)
+    if COLUMNA_NOMBRE in gdf.columns:
+        nombres = [str(n) for n in gdf[COLUMNA_NOMBRE]]
+    else:
+        nombres = [f"poligono_{k}" for k in range(len(gdf))]
+
+    bordes_lat, bordes_lon = _bordes(lat), _bordes(lon)
+    celdas = [
+        box(min(bordes_lon[j], bordes_lon[j + 1]), min(bordes_lat[i], bordes_lat[i + 1]),
+            max(bordes_lon[j], bordes_lon[j + 1]), max(bordes_lat[i], bordes_lat[i + 1]))
+        for i in range(len(lat)) for j in range(len(lon))
+    ]
+    coseno = np.repeat(np.cos(np.radians(np.asarray(lat, dtype=float))), len(lon))
+    arbol = STRtree(celdas)
+
+    pesos = np.zeros((len(nombres), len(celdas)))
+    for k, geom in enumerate(gdf.geometry):
+        if geom is None or geom.is_empty:
+            continue
+        for c in arbol.query(geom, predicate="intersects"):
+            pesos[k, c] = celdas[c].intersection(geom).area * coseno[c]
+    return nombres, pesos
+
+# Pesos (regiones x celdas) de los polígonos de un shapefile sobre la malla lat/lon
+def pesos_poligonos(ruta_shp, lat, lon, dir_cache=None):
+    import cache_geometria
+
+    dir_cache = dir_cache or cache_geometria.DIR_CACHE
+    st = os.stat(ruta_shp)
+    h = hashlib.sha1(f"{os.path.abspath(ruta_shp)}|{st.st_mtime_ns}|{st.st_size}|{COLUMNA_NOMBRE}|"
+                     f"{VERSION_PESOS}".encode("utf-8"))
+    h.update(np.ascontiguousarray(lat, dtype=float).tobytes())
+    h.update(np.ascontiguousarray(lon, dtype=float).tobytes())
+    nombre = os.path.splitext(os.path.basename(ruta_shp))[0]
+    ruta_cache = os.path.join(dir_cache, f"pesos_{nombre}_{h.hexdigest()[:16]}.npz")
+
+    if os.path.exists(ruta_cache):
+        with np.load(ruta_cache) as datos:
+            return [str(n) for n in datos["nombres"]], datos["pesos"]
+
+    nombres, pesos = _calcular_pesos(ruta_shp, lat, lon)
+    os.makedirs(dir_cache, exist_ok=True)
+    ruta_tmp = f"{ruta_cache}.{os.getpid()}.tmp.npz"
+    np.savez(ruta_tmp, nombres=np.array(nombres), pesos=pesos)
+    os.replace(ruta_tmp, ruta_cache)
+    return nombres, pesos
+
+# Índice plano de la celda más cercana a cada estación; None si queda fuera de la malla
+def celdas_estaciones(estaciones, lat, lon):
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    medio_lat, medio_lon = abs(lat[1] - lat[0]) / 2, abs(lon[1] - lon[0]) / 2
+    indices = []
+    for e in estaciones:
+        i, j = np.abs(lat - e["lat"]).argmin(), np.abs(lon - e["lon"]).argmin()
+        dentro = abs(lat[i] - e["lat"]) <= medio_lat and abs(lon[j] - e["lon"]) <= medio_lon
+        indices.append(int(i * len(lon) + j) if dentro else None)
+    return indices
+
+# Promedio ponderado de todos los plazos a la vez; las celdas NaN no cuentan
+def reducir(campo, pesos):
+    campo = np.asarray(campo, dtype=np.float64)
+    plano = campo.reshape(campo.shape[0], -1)
+    validos = ~np.isnan(plano)
+    suma = np.where(validos, plano, 0) @ pesos.T
+    total = validos.astype(np.float64) @ pesos.T
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(total > 0, suma / total, np.nan)
+
+def categoria_icca(valores, niveles, nombres):
+    # Mismas bandas que los mapas: niveles[k-1] < valor <= niveles[k]
+    indices = np.clip(np.digitize(valores, niveles[1:-1], right=True), 0, len(nombres) - 1)
+    etiquetas = np.array([" ".join(n.split()) for n in nombres], dtype=object)
+    return np.where(np.isnan(valores), None, etiquetas[indices])
+
+# Tabla larga (una fila por región/estación y plazo) a partir de los datos de cargar_datos
+def extraer(datos, ruta_departamentos, estaciones=None):
+    import pandas as pd
+    import procesamiento_cams as pc
+
+    estaciones = ESTACIONES if estaciones is None else estaciones
+    mallas = {"ca": (datos["lat"], datos["lon"]), "aod": (datos["lat_aod"], datos["lon_aod"])}
+    horas = list(datos["tiempo_sfc_str"])
+    n_plazos = min([len(horas)] + [len(datos[v]) for v, _, _ in VARIABLES])
+
+    regiones, nombres = {}, []
+    for malla, (lat, lon) in mallas.items():
+        nombres, pesos = pesos_poligonos(ruta_departamentos, lat, lon)
+        indices = celdas_estaciones(estaciones, lat, lon)
+        # Las estaciones se tratan como regiones de una sola celda
+        pesos_est = np.zeros((len(estaciones), len(lat) * len(lon)))
+        for k, c in enumerate(indices):
+            if c is not None:
+                pesos_est[k, c] = 1
+        regiones[malla] = np.vstack([pesos, pesos_est])
+    etiquetas = [("departamento", n) for n in nombres] + [("estacion", e["nombre"]) for e in estaciones]
+
+    columnas = {}
+    for variable, columna, malla in VARIABLES:
+        campo = np.asarray(datos[variable][:n_plazos])
+        columnas[columna] = reducir(campo, regiones[malla]).T  # regiones x plazos
+
+    n_regiones = len(etiquetas)
+    tabla = pd.DataFrame({
+        "tipo": np.repeat([t for t, _ in etiquetas], n_plazos),
+        "nombre": np.repeat([n for _, n in etiquetas], n_plazos),
+        "plazo": np.tile(np.arange(n_plazos), n_regiones),
+        "hora_local": np.tile(horas[:n_plazos], n_regiones),
+        **{c: np.round(v.ravel(), 3) for c, v in columnas.items()},
+    })
+    tabla["icca_pm10"] = categoria_icca(tabla["pm10"].to_numpy(), pc.niveles_pm10_icca, pc.categorias)
+    tabla["icca_pm25"] = categoria_icca(tabla["pm25"].to_numpy(), pc.niveles_pm25_icca, pc.categorias)
+    return tabla
+
+# Escribe series_cams_<ciclo UTC AAAAMMDDHH>.<formato> en `directorio`; devuelve las rutas escritas
+def exportar(datos, directorio, ruta_departamentos=None, estaciones=None, formatos=None):
+    import procesamiento_cams as pc
+    import metricas_cams
+
+    formatos = FORMATOS if formatos is None else formatos
+    with metricas_cams.etapa("series"):
+        tabla = extraer(datos, ruta_departamentos or pc.SHP_DEPARTAMENTOS, estaciones)
+        # Ciclo de inicialización en UTC (p. ej. 2026010100); la hora local del plazo 0 es
+        # del día anterior
+        ciclo = str(datos["ciclo"]).replace("-", "").replace("T", "")
+        os.makedirs(directorio, exist_ok=True)
+        rutas = []
+        for formato in formatos:
+            ruta = os.path.join(directorio, f"series_cams_{ciclo}.{formato}")
+            ruta_tmp = f"{ruta}.{os.getpid()}.tmp"
+            if formato == "csv":
+                tabla.to_csv(ruta_tmp, index=False)
+            elif formato == "json":
+                tabla.to_json(ruta_tmp, orient="records", force_ascii=False, indent=0)
+            elif formato == "parquet":
+                tabla.to_parquet(ruta_tmp, index=False)
+            else:
+                raise ValueError(f"Formato de series desconocido: {formato}")
+            os.replace(ruta_tmp, ruta)
+            rutas.append(ruta)
+    print(f"📊 Series por departamento y estación: {', '.join(os.path.basename(r) for r in rutas)}")
+    return rutas
+
+# Versión para el flujo operativo: respeta EXPORTAR, escribe en IMG_DIR/series y envía
+# las series al servidor. Devuelve True si terminó sin errores.
+def publicar(datos):
+    import procesamiento_cams as pc
+    import envio_cams
+
+    if not EXPORTAR:
+        return True
+    try:
+        rutas = exportar(datos, os.path.join(pc.IMG_DIR, "series"))
+    except Exception as e:
+        print(f"❌ Error extrayendo las series: {e}")
+        return False
+    return envio_cams.subir(rutas, f"{pc.DESTINO}/series")
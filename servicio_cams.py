@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# === Servicio local de graficado bajo demanda ===
+# Los plazos fuera de procesamiento_cams.PROGRAMA_FRAMES no se dibujan en la corrida
+# nocturna. Este servicio los dibuja con graficar_frame la primera vez que se piden
+# (GET /<producto>_<NNN>.<ext>, el mismo nombre que lista el manifiesto), los deja en
+# IMG_DIR con su clave en la caché de frames, así que las siguientes peticiones y la
+# corrida nocturna los reutilizan, y los sube a DESTINO junto a los demás frames del
+# producto (el siguiente manifiesto ya los lista como frames normales). La animación y el
+# ZIP del producto se regeneran y se suben ESPERA_EMPAQUETADO segundos después del
+# primer frame nuevo, una sola vez para todos los que se pidan en ese lapso. Mientras tanto
+# el visor los pide a URL_PUBLICA, que va en el manifiesto: para que el servidor web
+# llegue al servicio, DIRECCION tiene que ser una interfaz accesible desde él (p. ej.
+# "0.0.0.0") y URL_PUBLICA la dirección con la que el visor lo alcanza. Los frames se
+# dibujan de uno en uno en este proceso (matplotlib no es seguro entre hilos) y la
+# plantilla de cada producto se conserva entre peticiones. Lee los mismos NetCDF que la
+# última corrida (los del ciclo completo o los bloques del flujo incremental, según
+# registro_cams) y los recarga cuando cambian.
+DIRECCION = "127.0.0.1"
+PUERTO = 8765
+# URL base del servicio vista desde el visor, p. ej. "http://192.168.4.10:8765" (None = no
+# se anuncia en el manifiesto)
+URL_PUBLICA = None
+ESPERA_EMPAQUETADO = 60
+
+TIPOS = {"png": "image/png", "webp": "image/webp"}
+
+class Servicio:
+    def __init__(self, data_dir=None):
+        self.data_dir = data_dir
+        self.candado = threading.Lock()
+        self.firma = None
+        self.productos = {}
+        self.frames = {}
+        self.empaquetados = {}
+
+    # Entradas de la última corrida según el registro de frames: [(etiqueta, plazo_inicial)],
+    # los bloques de una corrida incremental aún sin unir o [("", 0)] para el ciclo completo
+    def _entradas(self):
+        import procesamiento_cams as pc
+        import registro_cams
+        import flujo_incremental
+
+        bloques = registro_cams.entradas(pc.IMG_DIR)
+        return [(flujo_incremental.etiqueta_bloque(p), p.start) for p in bloques] or [("", 0)]
+
+    def _rutas(self, etiqueta):
+        import procesamiento_cams as pc
+
+        data_dir = self.data_dir or pc.DATA_DIR
+        return [os.path.join(data_dir, f"{nombre}{etiqueta}.nc") for nombre in pc.NETCDF_DATOS]
+
+    def _firma_datos(self, entradas):
+        return tuple((ruta, os.stat(ruta).st_mtime_ns if os.path.exists(ruta) else None)
+                     for etiqueta, _ in entradas for ruta in self._rutas(etiqueta))
+
+    # Debe llamarse con el candado tomado
+    def _actualizar(self):
+        import procesamiento_cams as pc
+        import ensamble_cams
+
+        entradas = self._entradas()
+        firma = self._firma_datos(entradas)
+        if firma == self.firma:
+            return
+        # Las plantillas del ciclo anterior tienen otra hora de creación y pueden tener otra malla
+        pc.cerrar_plantillas()
+        etiqueta_hora = pc.crear_etiqueta_hora()
+        recursos, productos, self.ciclo = None, {}, None
+        # Cada bloque aporta sus plazos; los que aún no se descargan se omiten. El ensamble
+        # solo se calcula con el ciclo completo.
+        for etiqueta, inicio in entradas:
+            if etiqueta and not all(os.path.exists(r) for r in self._rutas(etiqueta)):
+                continue
+            datos = pc.cargar_datos(self.data_dir, etiqueta)
+            recursos = recursos or pc.cargar_recursos(datos)
+            lista = pc.definir_productos(datos, recursos, etiqueta_hora)
+            if not etiqueta:
+                # Un problema con el archivo histórico no impide servir los demás productos
+                try:
+                    lista += ensamble_cams.definir_productos(datos, recursos, etiqueta_hora)
+                except Exception as e:
+                    print(f"❌ Servicio: error calculando el ensamble de ciclos: {e}")
+            for producto in lista:
+                productos.setdefault(producto["nombre"], []).append((producto, inicio))
+            self.ciclo = datos["ciclo"]
+        self.productos = productos
+        self.frames = {}
+        self.firma = firma
+        print(f"🔄 Servicio: datos del ciclo {self.ciclo} ({len(self.productos)} productos, "
+              f"{len(entradas)} {'bloques' if entradas[0][0] else 'archivo completo'})")
+
+    # Argumentos de graficar_frame y huella de estilo de un producto (se preparan una vez por ciclo)
+    def _frames_producto(self, nombre):
+        import procesamiento_cams as pc
+
+        if nombre not in self.frames:
+            args, huella = {}, None
+            for producto, inicio in self.productos[nombre]:
+                lista, huella = pc.preparar_frames(nombre_archivo_base=os.path.join(pc.IMG_DIR, nombre),
+                                                   indice_inicial=inicio, **producto["parametros"])
+                args.update({a[0] + 1: a for a in lista})
+            self.frames[nombre] = (args, huella)
+        return self.frames[nombre]
+
+    # Ruta del frame en disco, dibujándolo si falta o si su clave cambió; None si no existe
+    # ese producto o plazo
+    def frame(self, nombre, n):
+        import procesamiento_cams as pc
+        import cache_frames
+        import envio_cams
+        import metricas_cams
+
+        with self.candado:
+            self._actualizar()
+            if nombre not in self.productos:
+                return None
+            args, huella = self._frames_producto(nombre)
+            if n not in args:
+                return None
+            base = os.path.join(pc.IMG_DIR, nombre)
+            ruta = pc.ruta_frame(base, n)
+            clave = pc.clave_frame(huella, args[n])
+            indice = cache_frames.leer_indice(base)
+            if indice.get(n) != clave or not os.path.exists(ruta):
+                print(f"🖌️ Servicio: graficando {os.path.basename(ruta)}")
+                metricas_cams.registrar_frame(pc.graficar_frame(args[n]), producto=nombre, modo="bajo_demanda")
+                # El índice se vuelve a leer por si la corrida nocturna lo actualizó mientras tanto
+                indice = cache_frames.leer_indice(base)
+                indice[n] = clave
+                cache_frames.guardar_indice(base, indice)
+                # En el servidor web queda junto a los frames del programa; si el envío
+                # falla el frame se sigue sirviendo desde aquí
+                destino = f"{pc.DESTINO}/{self.productos[nombre][0][0]['subcarpeta']}/images"
+                if not envio_cams.subir([ruta], destino):
+                    print(f"⚠️ Servicio: no se pudo enviar {os.path.basename(ruta)} a {destino}")
+                self._programar_empaquetado(nombre, self.productos[nombre][0][0]["subcarpeta"])
+            return ruta
+
+    # Debe llamarse con el candado tomado
+    def _programar_empaquetado(self, nombre, subcarpeta):
+        if nombre in self.empaquetados:
+            return
+        temporizador = threading.Timer(ESPERA_EMPAQUETADO, self._empaquetar, (nombre, subcarpeta))
+        temporizador.daemon = True
+        self.empaquetados[nombre] = temporizador
+        temporizador.start()
+
+    # Regenera y sube la animación y el ZIP con los frames en disco (sin volver a enviar
+    # los frames); no usa matplotlib, así que no toma el candado mientras empaqueta
+    def _empaquetar(self, nombre, subcarpeta):
+        import procesamiento_cams as pc
+
+        with self.candado:
+            self.empaquetados.pop(nombre, None)
+        try:
+            ok = pc.sincronizar(nombre, subcarpeta, frames=set())
+        except Exception as e:
+            print(f"❌ Servicio: error empaquetando {nombre}: {e}")
+            ok = False
+        if not ok:
+            print(f"⚠️ Servicio: no se pudo enviar la animación y el ZIP de {nombre}")
+
+    def estado(self):
+        with self.candado:
+            self._actualizar()
+            return {"ciclo": self.ciclo, "productos": sorted(self.productos)}
+
+def _manejador(servicio):
+    import procesamiento_cams as pc
+    import salida_cams
+
+    patron = re.compile(rf"^/(?P<producto>\w+)_(?P<frame>\d+)\.{salida_cams.extension(pc.FORMATO_FRAMES)}$")
+
+    class Manejador(BaseHTTPRequestHandler):
+        def _responder(self, codigo, cuerpo, tipo):
+            self.send_response(codigo)
+            self.send_header("Content-Type", tipo)
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def do_GET(self):
+            try:
+                if self.path in ("/", "/estado"):
+                    cuerpo = json.dumps(servicio.estado(), ensure_ascii=False).encode("utf-8")
+                    return self._responder(200, cuerpo, "application/json")
+                coincidencia = patron.fullmatch(self.path.split("?")[0])
+                ruta = coincidencia and servicio.frame(coincidencia["producto"], int(coincidencia["frame"]))
+                if not ruta:
+                    return self._responder(404, b"Frame desconocido\n", "text/plain")
+                with open(ruta, "rb") as f:
+                    cuerpo = f.read()
+                self._responder(200, cuerpo, TIPOS[salida_cams.extension(pc.FORMATO_FRAMES)])
+            except Exception as e:
+                print(f"❌ Servicio: error atendiendo {self.path}: {e}")
+                self._responder(500, f"Error: {e}\n".encode("utf-8"), "text/plain")
+
+        def log_message(self, formato, *args):
+            pass
+
+    return Manejador
+
+def servir(direccion=None, puerto=None, data_dir=None):
+    import matplotlib
+    matplotlib.use("Agg")
+
+    servicio = Servicio(data_dir)
+    servidor = ThreadingHTTPServer((direccion or DIRECCION, puerto or PUERTO), _manejador(servicio))
+    print(f"🌐 Servicio de graficado bajo demanda en http://{servidor.server_address[0]}:{servidor.server_address[1]}/")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+    return True